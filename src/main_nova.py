@@ -6,7 +6,7 @@ import asyncio
 import logging
 import time
 import warnings
-import json
+from collections import deque
 
 #remove deprecation warnings from transformers
 warnings.filterwarnings(
@@ -69,11 +69,6 @@ if 'torch' in sys.modules:
 # Third-party imports
 import cohere
 from huggingface_hub import login
-from transformers import (
-    AutoModelForSequenceClassification,
-    AutoTokenizer,
-    pipeline
-)
 from pinecone import Pinecone
 from FlagEmbedding import BGEM3FlagModel
 from langsmith import Client, traceable, trace
@@ -81,12 +76,12 @@ from langchain_community.tools.tavily_search import TavilySearchResults
 
 # Local imports
 from src.models.redis_cache import ClimateCache
-from src.models.nova_flow import BedrockModel
-from src.models.gen_response_nova import nova_chat
+from src.models.nova_flow import BedrockModel, close_async_client
+from src.models.gen_response_nova import nova_chat, MAX_HISTORY_TURNS
 from src.models.query_routing import MultilingualRouter
-from src.models.input_guardrail import topic_moderation, check_follow_up_with_llm
+from src.models.input_guardrail import topic_moderation, check_follow_up_with_llm, build_moderation_pipeline, load_climatebert
 from src.models.retrieval import get_documents
-from src.models.hallucination_guard import extract_contexts, check_hallucination
+from src.models.hallucination_guard import extract_contexts, check_hallucination, close_cohere_clients
 from src.models.query_rewriter import query_rewriter
 from src.data.config.azure_config import get_azure_settings
 
@@ -103,6 +98,10 @@ warnings.filterwarnings("ignore", category=Warning)
 # If running in Azure, include Azure settings
 AZURE_SETTINGS = get_azure_settings() if is_running_in_azure() else {}
 
+async def close_loop_clients() -> None:
+    """Close the Bedrock and Cohere clients shared on the running event loop; call before closing the loop."""
+    await asyncio.gather(close_async_client(), close_cohere_clients())
+
 class MultilingualClimateChatbot:
     """
     A multilingual chatbot specialized in climate-related topics.
@@ -241,14 +240,10 @@ class MultilingualClimateChatbot:
                 try:
                     # Set offline mode to force local file usage
                     os.environ["HF_HUB_OFFLINE"] = "1"
-                    self.climatebert_model = AutoModelForSequenceClassification.from_pretrained(
-                        str(azure_model_path),
-                        local_files_only=True
-                    )
-                    self.climatebert_tokenizer = AutoTokenizer.from_pretrained(
+                    self.climatebert_model, self.climatebert_tokenizer = load_climatebert(
                         str(azure_model_path),
-                        max_length=512,
-                        local_files_only=True
+                        local_files_only=True,
+                        max_length=512
                     )
                     os.environ.pop("HF_HUB_OFFLINE", None)  # Remove offline mode
                     logger.info("✓ Successfully loaded ClimateBERT from Azure directory")
@@ -263,14 +258,10 @@ class MultilingualClimateChatbot:
                 try:
                     # Set offline mode to force local file usage
                     os.environ["HF_HUB_OFFLINE"] = "1"
-                    self.climatebert_model = AutoModelForSequenceClassification.from_pretrained(
+                    self.climatebert_model, self.climatebert_tokenizer = load_climatebert(
                         str(local_model_path),
-                        local_files_only=True
-                    )
-                    self.climatebert_tokenizer = AutoTokenizer.from_pretrained(
-                        str(local_model_path),
-                        max_length=512,
-                        local_files_only=True
+                        local_files_only=True,
+                        max_length=512
                     )
                     os.environ.pop("HF_HUB_OFFLINE", None)  # Remove offline mode
                     logger.info("✓ Successfully loaded ClimateBERT from local directory")
@@ -281,10 +272,9 @@ class MultilingualClimateChatbot:
             
             # If model still not loaded, download from Hugging Face
             if not model_loaded:
-                logger.info(f"Local model not found. Downloading from Hugging Face.")
+                logger.info("Local model not found. Downloading from Hugging Face.")
                 try:
-                    self.climatebert_model = AutoModelForSequenceClassification.from_pretrained(model_name)
-                    self.climatebert_tokenizer = AutoTokenizer.from_pretrained(model_name, max_length=512)
+                    self.climatebert_model, self.climatebert_tokenizer = load_climatebert(model_name, max_length=512)
                     model_loaded = True
                     logger.info("✓ Successfully loaded ClimateBERT from Hugging Face")
                 except Exception as hf_err:
@@ -296,12 +286,9 @@ class MultilingualClimateChatbot:
                 raise ValueError("ClimateBERT model or tokenizer not properly initialized")
                 
             # Set up pipeline
-            device = 0 if torch.cuda.is_available() else -1 
-            self.topic_moderation_pipe = pipeline(
-                "text-classification",
-                model=self.climatebert_model,
-                tokenizer=self.climatebert_tokenizer,
-                device=device,
+            self.topic_moderation_pipe = build_moderation_pipeline(
+                self.climatebert_model,
+                self.climatebert_tokenizer,
                 truncation=True,
                 max_length=512
             )
@@ -375,7 +362,7 @@ class MultilingualClimateChatbot:
                 # Simple sync test first
                 if hasattr(self.redis_client, 'redis_client'):
                     self.redis_client.redis_client.ping()
-                    logger.info(f"✓ Redis connection test successful using sync ping")
+                    logger.info("✓ Redis connection test successful using sync ping")
                 else:
                     logger.warning("Redis client initialized but redis_client attribute not found")
             except Exception as e:
@@ -434,7 +421,7 @@ class MultilingualClimateChatbot:
                                       list(self.LANGUAGE_VARIATIONS.keys())))
         raise ValueError(
             f"Unsupported language: {language_name}\n" +
-            f"Available languages:\n" +
+            "Available languages:\n" +
             f"{', '.join(available_languages)}"
         )
         
@@ -575,7 +562,7 @@ class MultilingualClimateChatbot:
                         cached_result = await self.redis_client.get(cache_key)
                         if cached_result:
                             cache_time = time.time() - start_time
-                            logger.info(f"✨ Cache hit - returning cached response")
+                            logger.info("✨ Cache hit - returning cached response")
                             # Create current turn with cached response for conversation history
                             current_turn = {
                                 "query": norm_query,
@@ -686,7 +673,8 @@ class MultilingualClimateChatbot:
                                 follow_up_result = await check_follow_up_with_llm(
                                     query=english_query, 
                                     conversation_history=conversation_history,
-                                    nova_model=self.nova_model
+                                    nova_model=self.nova_model,
+                                    similarity_model=getattr(self, 'similarity_model', None)
                                 )
                                 
                                 is_follow_up = follow_up_result.get('is_follow_up', False)
@@ -760,7 +748,12 @@ class MultilingualClimateChatbot:
                                             retrieval_query = english_query
                             
                             # Document retrieval includes hybrid search and reranking
-                            reranked_docs = await get_documents(retrieval_query, self.index, self.embed_model, self.cohere_client)
+                            # The dense embedding retrieval computes is reused by the semantic cache
+                            retrieval_embedding = []
+                            reranked_docs = await get_documents(
+                                retrieval_query, self.index, self.embed_model, self.cohere_client,
+                                dense_out=retrieval_embedding
+                            )
                             step_times['retrieval'] = time.time() - retrieval_start
                             logger.info(f"📚 Retrieved and reranked {len(reranked_docs)} documents")
                         except Exception as e:
@@ -772,27 +765,36 @@ class MultilingualClimateChatbot:
                         try:
                             logger.info("✍️ Starting response generation with conversation history...")
                             
-                            # Format conversation history for the model
-                            formatted_history = []
+                            # Format conversation history for the model; the deque keeps
+                            # only the most recent MAX_HISTORY_TURNS messages
+                            formatted_history = deque(maxlen=MAX_HISTORY_TURNS)
                             if conversation_history and len(conversation_history) > 0:
                                 logger.info(f"Processing conversation history with {len(conversation_history)} previous turns")
-                                for turn in conversation_history:
+                                
+                                async def _turn_in_english(turn):
                                     # Translate history items if needed
                                     if language_code != 'en' and turn.get('language_code') != 'en':
-                                        user_msg = await self.nova_model.nova_translation(
-                                            turn.get('query', ''), 
-                                            turn.get('language_name', language_name), 
-                                            'english'
-                                        )
-                                        assistant_msg = await self.nova_model.nova_translation(
-                                            turn.get('response', ''), 
-                                            turn.get('language_name', language_name), 
-                                            'english'
+                                        return await asyncio.gather(
+                                            self.nova_model.nova_translation(
+                                                turn.get('query', ''), 
+                                                turn.get('language_name', language_name), 
+                                                'english'
+                                            ),
+                                            self.nova_model.nova_translation(
+                                                turn.get('response', ''), 
+                                                turn.get('language_name', language_name), 
+                                                'english'
+                                            )
                                         )
-                                    else:
-                                        user_msg = turn.get('query', '')
-                                        assistant_msg = turn.get('response', '')
-                                    
+                                    return turn.get('query', ''), turn.get('response', '')
+                                
+                                # Issue all history translations concurrently rather than one Nova call at a time
+                                # Only the turns that fit in the deque (two messages each) are worth translating
+                                recent_turns = conversation_history[-(MAX_HISTORY_TURNS // 2):]
+                                english_turns = await asyncio.gather(
+                                    *(_turn_in_english(turn) for turn in recent_turns)
+                                )
+                                for user_msg, assistant_msg in english_turns:
                                     # Add properly formatted conversation turns
                                     formatted_history.append({"role": "user", "content": user_msg})
                                     formatted_history.append({"role": "assistant", "content": assistant_msg})
@@ -801,14 +803,20 @@ class MultilingualClimateChatbot:
                                 
                                 # Log a sample of the conversation history for debugging
                                 if formatted_history:
-                                    logger.debug(f"Sample conversation turn: {formatted_history[:2]}")
+                                    logger.debug(f"Sample conversation turn: {list(formatted_history)[:2]}")
+                            
+                            # Standalone queries can be answered from the semantic cache
+                            query_embedding = None
+                            if not formatted_history and retrieval_embedding and retrieval_query == english_query:
+                                query_embedding = retrieval_embedding[0]
                             
                             # Call nova_chat with conversation history
                             response, citations = await nova_chat(
                                 english_query, 
                                 reranked_docs, 
                                 self.nova_model,
-                                conversation_history=formatted_history
+                                conversation_history=formatted_history,
+                                query_embedding=query_embedding
                             )
                             step_times['generation'] = time.time() - generation_start
                             logger.info("✍️ Response generation complete")
@@ -1049,7 +1057,7 @@ class MultilingualClimateChatbot:
 
     async def cleanup(self) -> None:
         """Clean up resources."""
-        cleanup_tasks = []
+        cleanup_tasks = [close_loop_clients()]
         cleanup_errors = []
 
         # Close Redis connection if it exists
@@ -1196,14 +1204,14 @@ async def main() -> None:
                     
                 print("\n" + "-"*50)  # Separator line
                     
-            except KeyboardInterrupt as e:
+            except KeyboardInterrupt:
                 print("\n\nExiting gracefully...")
                 break
             except Exception as e:
                 print(f"\nError: {str(e)}")
                 print("Please try again.")
                 
-    except KeyboardInterrupt as e:
+    except KeyboardInterrupt:
         print("\n\nExiting gracefully...")
     except Exception as e:
         print(f"\nFatal error: {str(e)}")
@@ -1219,7 +1227,7 @@ async def main() -> None:
 if __name__ == "__main__":
     try:
         asyncio.run(main())
-    except KeyboardInterrupt as e:
+    except KeyboardInterrupt:
         print("\nProgram terminated by user")
     except Exception as e:
         print(f"\nProgram terminated due to error: {str(e)}")
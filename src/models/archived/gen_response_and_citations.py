@@ -2,33 +2,71 @@ import os
 import cohere
 import logging
 from src.utils.env_loader import load_environment
-from src.models.redis_cache import ClimateCache
-from typing import List, Dict, Tuple, Any, AsyncGenerator
+from src.models.redis_cache import ClimateCache, HotCache
+from src.models.doc_utils import clean_content, first_url
+from typing import List, Dict, Tuple, Any, AsyncGenerator, Iterator, Optional
+from dataclasses import dataclass
+import functools
+import hashlib
 import time
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import json
+import contextlib
+import orjson
 
 logger = logging.getLogger(__name__)
 
-def citation_to_dict(citation: Any) -> Dict:
-    """Convert Cohere citation object to a serializable dictionary."""
-    return {
-        'start': citation.start,
-        'end': citation.end,
-        'text': citation.text,
-        'type': citation.type,
-        'sources': [
-            {
-                'type': source.type,
-                'id': source.id,
-                'document': source.document
-            }
-            for source in citation.sources
-        ] if hasattr(citation, 'sources') else []
-    }
-
-def process_single_doc(doc: Dict) -> Dict:
+# Bounded buffer between the Cohere stream reader and the consumer; when the
+# consumer falls behind the reader blocks instead of buffering the whole reply
+STREAM_QUEUE_SIZE = 64
+# Upper bound (in characters) on how many queued chunks are coalesced per yield
+STREAM_FLUSH_SIZE = 16 * 1024
+_STREAM_DONE = object()
+
+def _stream_text(event: Any) -> Optional[str]:
+    """Text carried by a Cohere V2 chat stream event, or None for non-text events."""
+    if getattr(event, 'type', None) != 'content-delta':
+        return None
+    try:
+        return event.delta.message.content.text
+    except AttributeError:
+        return None
+
+# Cohere shows diminishing returns past ~20 documents while input cost keeps growing
+MAX_DOCS = int(os.getenv('COHERE_MAX_DOCS', '20'))
+
+# Preprocessed document sets, keyed by document digest; these change rarely.
+# Stored as tuples of frozen CohereDocs and handed out as fresh lists
+_PROCESSED_DOCS_CACHE = HotCache(maxsize=256, ttl=3600)
+
+@dataclass(slots=True, frozen=True)
+class CohereDoc:
+    """Compact record for a preprocessed document; converted to a dict only at the Cohere API boundary."""
+    title: str
+    snippet: str
+
+    def as_document(self) -> Dict:
+        """Return the nested dict shape expected by the Cohere chat API."""
+        return {'data': {'title': self.title, 'snippet': self.snippet}}
+
+def _citation_encoder(obj: Any) -> Dict:
+    """orjson ``default`` hook that flattens Cohere citation and source objects."""
+    if hasattr(obj, 'start'):
+        return {
+            'start': obj.start,
+            'end': obj.end,
+            'text': obj.text,
+            'type': obj.type,
+            'sources': list(getattr(obj, 'sources', None) or [])
+        }
+    if hasattr(obj, 'document'):
+        return {
+            'type': obj.type,
+            'id': obj.id,
+            'document': obj.document
+        }
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def process_single_doc(doc: Dict) -> Optional[CohereDoc]:
     """Process a single document for Cohere chat."""
     try:
         title = doc.get('title', '')
@@ -43,30 +81,40 @@ def process_single_doc(doc: Dict) -> Dict:
         if not title or not content:
             return None
             
-        content = content.replace('\\n', ' ').replace('\\"', '"').strip()
+        content = clean_content(content)
         if len(content) < 10:
             return None
             
-        return {
-            'data': {
-                "title": f"{title}: {url}" if url else title,
-                "snippet": content
-            }
-        }
+        return CohereDoc(
+            title=f"{title}: {url}" if url else title,
+            snippet=content
+        )
             
-    except Exception as e:
+    except (KeyError, AttributeError, TypeError) as e:
         logger.error(f"Error processing document: {str(e)}")
         return None
 
-def doc_preprocessing(docs: List[Dict]) -> List[Dict]:
-    """Prepare documents for Cohere chat using parallel processing."""
-    logger.debug(f"Processing {len(docs)} documents for Cohere")
+def doc_preprocessing(docs: List[Dict]) -> List[CohereDoc]:
+    """Prepare documents for Cohere chat."""
+    logger.debug("Processing %d documents for Cohere", len(docs))
     
-    with ThreadPoolExecutor() as executor:
-        processed_docs = list(executor.map(process_single_doc, docs))
+    # Per-document work is microseconds of string handling; a thread pool only adds overhead
+    processed_docs = [
+        process_single_doc(doc) for doc in docs
+        if doc.get('title') and (doc.get('content') or doc.get('chunk_text'))
+    ]
     
-    # Filter out None values from failed processing
-    documents = [doc for doc in processed_docs if doc is not None]
+    # Filter out None values from failed processing and drop duplicate
+    # (title, url) entries, which are common after reranker merges
+    documents = []
+    seen = set()
+    for doc in processed_docs:
+        if doc is None or doc.title in seen:
+            continue
+        seen.add(doc.title)
+        documents.append(doc)
+        if len(documents) >= MAX_DOCS:
+            break
     
     if documents:
         logger.info(f"Successfully processed {len(documents)} documents for Cohere")
@@ -75,54 +123,100 @@ def doc_preprocessing(docs: List[Dict]) -> List[Dict]:
         
     return documents
 
-def generate_cache_key(query: str, docs: List[Dict]) -> str:
-    """Generate a unique cache key based on query and document content."""
-    # Use a more stable hash generation for docs
-    doc_identifiers = sorted([
-        f"{d.get('title', '')}:{d.get('url', '')}"
-        for d in docs
-    ])
-    doc_key = hash(tuple(doc_identifiers))  # Using tuple for stable hash
-    query_key = hash(query.lower().strip())  # Normalize query
+DocsKey = Tuple[Tuple[str, str], ...]
+
+def _doc_identifiers(docs: List[Dict]) -> DocsKey:
+    """Return the sorted, de-duplicated (title, url) pairs of a document set."""
+    return tuple(sorted({(d.get('title', ''), first_url(d.get('url', ''))) for d in docs}))
+
+def _update_with_pairs(h, docs_key: DocsKey) -> None:
+    """Feed (title, url) pairs to a hash, \x1f before each title and \x1e between title and url."""
+    for title, url in docs_key:
+        h.update(b'\x1f')
+        h.update(title.encode('utf-8'))
+        h.update(b'\x1e')
+        h.update(url.encode('utf-8'))
+
+@functools.lru_cache(maxsize=256)
+def _docs_digest(docs_key: DocsKey) -> str:
+    """Stable digest of a document identifier tuple, memoized across turns."""
+    h = hashlib.blake2b(digest_size=16)
+    _update_with_pairs(h, docs_key)
+    return h.hexdigest()
+
+def _key_verifier(query: str, docs_key: DocsKey) -> str:
+    """Full SHA-256 of the canonical cache inputs, stored alongside cached values
+    so a truncated-key collision surfaces as a miss instead of another answer."""
+    h = hashlib.sha256(query.lower().strip().encode('utf-8'))
+    _update_with_pairs(h, docs_key)
+    return h.hexdigest()
+
+def _is_verified_hit(cached_result: Optional[Dict], verifier: str) -> bool:
+    """Check a cached entry against the verifier for the current inputs."""
+    if not cached_result:
+        return False
+    if cached_result.get('key_verifier') != verifier:
+        logger.warning("Cache key verifier mismatch - treating as cache miss")
+        return False
+    return True
+
+def _preprocess_cached(documents: List[Dict], docs_key: DocsKey) -> List[CohereDoc]:
+    """Run doc_preprocessing once per document set and reuse it across queries."""
+    cache_key = f"cohere_docs:{_docs_digest(docs_key)}"
+    records = _PROCESSED_DOCS_CACHE.get(cache_key)
+    if records is None:
+        documents_processed = doc_preprocessing(documents)
+        if documents_processed:
+            _PROCESSED_DOCS_CACHE.set(cache_key, tuple(documents_processed))
+        return documents_processed
+    return list(records)
+
+def generate_cache_key(query: str, docs: List[Dict], docs_key: Optional[DocsKey] = None) -> str:
+    """Generate a unique cache key based on query and document content.
+
+    Pass precomputed ``docs_key`` identifiers to avoid rebuilding them for a
+    shared document set. Digests are stable across processes, unlike ``hash()``.
+    """
+    doc_key = _docs_digest(docs_key if docs_key is not None else _doc_identifiers(docs))
+    query_key = hashlib.blake2b(
+        query.lower().strip().encode('utf-8'), digest_size=16  # Normalize query
+    ).hexdigest()
     return f"cohere_response:{query_key}:{doc_key}"
 
-async def cohere_chat(query: str, documents: List[Dict], cohere_client, description: str = None) -> Tuple[str, List]:
+async def cohere_chat(query: str, documents: List[Dict], cohere_client, description: str = None, docs_key: Optional[DocsKey] = None) -> Tuple[str, List]:
     """
     Returns the response from Cohere with caching support.
+
+    Expects a ``cohere.AsyncClientV2``, so the request does not block the event loop.
     """
     try:
         # Initialize cache
         cache = ClimateCache()
-        cache_key = generate_cache_key(query, documents)
+        if docs_key is None:
+            docs_key = _doc_identifiers(documents)
+        cache_key = generate_cache_key(query, documents, docs_key)
+        verifier = _key_verifier(query, docs_key)
         
-        # Try to get cached response
-        cached_result = cache.get_from_cache(cache_key)
-        if cached_result:
+        # ClimateCache checks its in-process tier before Redis and returns a fresh copy
+        cached_result = await cache.get(cache_key)
+        if _is_verified_hit(cached_result, verifier):
             logger.info("Cache hit - returning cached response")
             return cached_result['response'], [
                 cohere.Citation(**citation_dict) 
-                for citation_dict in cached_result['citations']
+                for citation_dict in orjson.loads(cached_result.get('citations_json', '[]'))
             ]
 
-        # Process documents in parallel
-        documents_processed = doc_preprocessing(documents)
+        # Process documents, reusing the result for a document set seen before
+        documents_processed = _preprocess_cached(documents, docs_key)
         if not documents_processed:
             raise ValueError("No valid documents to process")
 
-        messages = [
-            {"role": "system", "content": system_message},
-            {
-                "role": "user",
-                "content": f"Question: {query}" +
-                          (f" [description: {description}]" if description else "") +
-                          "\n Answer:",
-            }
-        ]
+        messages = [_SYSTEM_MESSAGE_DICT, _build_user_message(query, description)]
         
-        res = cohere_client.chat(
+        res = await cohere_client.chat(
             model="command-r-plus-08-2024",
             messages=messages,
-            documents=documents_processed
+            documents=[doc.as_document() for doc in documents_processed]
         )
 
         if hasattr(res.message, 'content'):
@@ -132,12 +226,14 @@ async def cohere_chat(query: str, documents: List[Dict], cohere_client, descript
 
         citations = res.message.citations if hasattr(res.message, 'citations') else []
         
-        # Cache the result with serializable citations
+        # Cache the result with citations serialized in one orjson pass so
+        # they are only decoded when a caller actually needs them
         cache_data = {
             'response': response_text,
-            'citations': [citation_to_dict(citation) for citation in citations]
+            'citations_json': orjson.dumps(citations or [], default=_citation_encoder).decode(),
+            'key_verifier': verifier
         }
-        cache.save_to_cache(cache_key, cache_data)
+        await cache.set(cache_key, cache_data)
         
         return response_text, citations
 
@@ -145,69 +241,156 @@ async def cohere_chat(query: str, documents: List[Dict], cohere_client, descript
         logger.error(f"Error in cohere_chat: {str(e)}")
         raise
 
-def cohere_chat_stream(query: str, documents: List[Dict], cohere_client, description: str = None):
+async def cohere_chat_stream(query: str, documents: List[Dict], cohere_client, description: str = None) -> AsyncGenerator[str, None]:
     """
-    Synchronous streaming version of cohere_chat that yields response chunks as they arrive.
+    Streaming version of cohere_chat that yields response chunks as they arrive.
+
+    Expects a ``cohere.AsyncClientV2``; synchronous callers can use
+    cohere_chat_stream_sync. The provider stream is read by a background
+    task into a bounded queue, so a slow consumer applies backpressure to the
+    reader. Chunks that pile up while the consumer is busy are coalesced into a
+    single yield of up to STREAM_FLUSH_SIZE characters.
     """
     try:
         # Initialize cache
         cache = ClimateCache()
-        cache_key = generate_cache_key(query, documents)
+        docs_key = _doc_identifiers(documents)
+        cache_key = generate_cache_key(query, documents, docs_key)
+        verifier = _key_verifier(query, docs_key)
         
         # Try to get cached response
-        cached_result = cache.get_from_cache(cache_key)
-        if cached_result:
+        cached_result = await cache.get(cache_key)
+        if _is_verified_hit(cached_result, verifier):
             logger.info("Cache hit - returning cached response")
             yield cached_result['response']
             return
 
-        # Process documents in parallel
-        documents_processed = doc_preprocessing(documents)
+        # Process documents, reusing the result for a document set seen before
+        documents_processed = _preprocess_cached(documents, docs_key)
         if not documents_processed:
             raise ValueError("No valid documents to process")
 
-        messages = [
-            {"role": "system", "content": system_message},
-            {
-                "role": "user",
-                "content": f"Question: {query}" +
-                          (f" [description: {description}]" if description else "") +
-                          "\n Answer:",
-            }
-        ]
+        messages = [_SYSTEM_MESSAGE_DICT, _build_user_message(query, description)]
         
         # Get the stream response
         stream = cohere_client.chat_stream(
             model="command-r-plus-08-2024",
             messages=messages,
-            documents=documents_processed
+            documents=[doc.as_document() for doc in documents_processed]
         )
 
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+        async def _read_stream():
+            # Cancellation means the consumer stopped reading, so nothing more is queued
+            try:
+                async for event in stream:
+                    text = _stream_text(event)
+                    if text:
+                        await queue.put(text)
+            except Exception as e:
+                await queue.put(e)
+            else:
+                await queue.put(_STREAM_DONE)
+
+        reader = asyncio.create_task(_read_stream())
         full_response = []
-        for chunk in stream:
-            if chunk and hasattr(chunk, 'text'):
-                yield chunk.text
-                full_response.append(chunk.text)
+        try:
+            done = False
+            while not done:
+                item = await queue.get()
+                batch = []
+                batch_size = 0
+                # Coalesce whatever else is already queued, up to the flush size
+                while True:
+                    if item is _STREAM_DONE:
+                        done = True
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    batch.append(item)
+                    batch_size += len(item)
+                    if batch_size >= STREAM_FLUSH_SIZE or queue.empty():
+                        break
+                    item = queue.get_nowait()
+                if batch:
+                    text = ''.join(batch)
+                    full_response.append(text)
+                    yield text
+        finally:
+            # The consumer may stop early (break / aclose): stop the reader, then the provider stream
+            if not reader.done():
+                reader.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await reader
+            aclose = getattr(stream, 'aclose', None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception as e:
+                    logger.warning(f"Error closing Cohere stream: {str(e)}")
 
         # Cache the complete response
         final_response = ''.join(full_response)
         cache_data = {
             'response': final_response,
-            'citations': []
+            'citations_json': '[]',
+            'key_verifier': verifier
         }
-        cache.save_to_cache(cache_key, cache_data)
+        await cache.set(cache_key, cache_data)
 
     except Exception as e:
         logger.error(f"Error in cohere_chat_stream: {str(e)}")
         raise
 
+def cohere_chat_stream_sync(query: str, documents: List[Dict], cohere_client, description: str = None) -> Iterator[str]:
+    """
+    Synchronous wrapper around cohere_chat_stream for callers without an event loop.
+
+    Drives the async generator on a private event loop, one chunk per step;
+    takes the same ``cohere.AsyncClientV2``.
+    """
+    loop = asyncio.new_event_loop()
+    stream = cohere_chat_stream(query, documents, cohere_client, description)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(stream.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(stream.aclose())
+        loop.close()
+
 async def process_batch_queries(queries: List[str], documents: List[Dict], cohere_client) -> List[str]:
     """
-    Process multiple queries in parallel using asyncio.gather
+    Process multiple queries in parallel using asyncio.gather.
+
+    Documents are hashed once for the whole batch, cached responses are fetched
+    with a single MGET, and only the misses are sent to Cohere with at most
+    COHERE_MAX_INFLIGHT requests in flight.
     """
-    tasks = [cohere_chat(query, documents, cohere_client) for query in queries]
-    results = await asyncio.gather(*tasks)
-    return [response for response, _ in results]
+    docs_key = _doc_identifiers(documents)
+    cache_keys = [generate_cache_key(query, documents, docs_key) for query in queries]
+    cached_results = await ClimateCache().get_many(cache_keys)
+
+    semaphore = asyncio.Semaphore(int(os.getenv("COHERE_MAX_INFLIGHT", "16")))
+
+    async def _run(query: str, cached_result: Optional[Dict]) -> str:
+        if _is_verified_hit(cached_result, _key_verifier(query, docs_key)):
+            return cached_result['response']
+        async with semaphore:
+            response, _ = await cohere_chat(query, documents, cohere_client, docs_key=docs_key)
+            return response
+
+    tasks = [_run(query, cached) for query, cached in zip(queries, cached_results)]
+    return await asyncio.gather(*tasks)
+
+def _build_user_message(query: str, description: str = None) -> Dict:
+    """Build the user turn, picking the template once instead of concatenating pieces."""
+    if description:
+        return {"role": "user", "content": _USER_DESC_FMT(q=query, d=description)}
+    return {"role": "user", "content": _USER_NO_DESC_FMT(q=query)}
 
 # Define the system message used for context
 system_message = """
@@ -232,6 +415,11 @@ Avoid causing fear or anxiety; focus on empowerment and hope.
 Align with ethical principles to avoid harm and respect diverse perspectives.
 """
 
+# Message pieces that are identical on every call (treat as read-only)
+_SYSTEM_MESSAGE_DICT = {"role": "system", "content": system_message}
+_USER_NO_DESC_FMT = "Question: {q}\n Answer:".format
+_USER_DESC_FMT = "Question: {q} [description: {d}]\n Answer:".format
+
 # Main execution
 if __name__ == "__main__":
     start_time = time.time()
@@ -241,7 +429,7 @@ if __name__ == "__main__":
     if not COHERE_API_KEY:
         raise EnvironmentError("COHERE_API_KEY not found in environment variables.")
     
-    cohere_client = cohere.ClientV2(api_key=COHERE_API_KEY)
+    cohere_client = cohere.AsyncClientV2(api_key=COHERE_API_KEY)
     
     # Test case setup for example purposes
     docs_reranked=[
@@ -295,8 +483,12 @@ if __name__ == "__main__":
     try:
         print("\nTesting streaming response:")
         query = "What is climate change?"
-        for chunk in cohere_chat_stream(query, docs_reranked, cohere_client):
-            print(chunk, end='', flush=True)
+
+        async def _print_stream():
+            async for chunk in cohere_chat_stream(query, docs_reranked, cohere_client):
+                print(chunk, end='', flush=True)
+
+        asyncio.run(_print_stream())
         print("\n")
         
         print("Processing time:", time.time() - start_time)
@@ -1,8 +1,9 @@
-import os
-import json
+import io
+import orjson
 import logging
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, AsyncGenerator
 from src.models.nova_flow import BedrockModel
+from src.models.doc_utils import preprocess_docs, first_url, trim_docs_to_budget
 
 # Configure logging
 logging.basicConfig(
@@ -40,6 +41,14 @@ default_persona_prompt = """
     - Align with ethical principles to avoid harm and respect diverse perspectives.
     """
 
+# Static parts of the NovaChat prompt, built once at import
+_PROMPT_HEADER = "\n".join([
+    "You are a helpful climate science expert. Answer the question based ONLY on the provided content.",
+    "Be direct, accurate, and focused on climate topics.",
+    "If information is insufficient, say so rather than speculating."
+])
+_PROMPT_FOOTER = "\n\nProvide a clear, factual answer using only the information from these sources."
+
 def get_citation_info(docs):
     """
     Prepare documents for Cohere chat.
@@ -56,56 +65,18 @@ def get_citation_info(docs):
     if not docs:
         raise ValueError("No documents were provided")
         
-    citations = []
-    logger.debug(f"Processing {len(docs)} documents")
-    
-    for doc in docs:
-        try:
-            # Extract required fields
-            title = doc.get('title', '')
-            content = doc.get('content', '')  # Primary content field
-            if not content:
-                content = doc.get('chunk_text', '')  # Fallback content field
-                
-            # Get URL(s)
-            url = doc.get('url', [])
-            if isinstance(url, list) and url:
-                url = url[0]
-            elif isinstance(url, str):
-                url = url
-            else:
-                url = ''
-                
-            # Validation
-            if not title or not content:
-                logger.warning(f"Missing required fields - Title: {bool(title)}, Content: {bool(content)}")
-                continue
-                
-            # Clean content
-            content = content.replace('\\n', ' ').replace('\\"', '"').strip()
-            if len(content) < 10:
-                logger.warning(f"Content too short for document: {title}")
-                continue
-                
-            citation = {
-                "title": f"{title}: {url}" if url else title,
-                "snippet": content
-            }
-            
-            logger.debug(f"Processed document - Title: {title}")
-            logger.debug(f"Content length: {len(content)}")
-            
-            citations.append(citation)
-            
-        except Exception as e:
-            logger.error(f"Error processing document: {str(e)}")
-            continue
+    citations = [
+        {
+            "title": f"{doc['title']}: {doc['url']}" if doc['url'] else doc['title'],
+            "snippet": doc['content']
+        }
+        for doc in preprocess_docs(docs)
+    ]
     
     if not citations:
         logger.error("No documents were processed")
         raise ValueError("No documents were provided")
         
-    logger.info(f"Successfully processed {len(citations)} documents")
     return citations
 
 class NovaChat(BedrockModel):
@@ -139,26 +110,7 @@ class NovaChat(BedrockModel):
             Tuple[str, List[str]]: Generated response and citations
         """
         try:
-            # Format documents and build context
-            formatted_docs = []
-            urls = []  # Track URLs for citation
-            
-            for doc in retrieved_docs:
-                if not doc.get('content'):
-                    continue
-                    
-                # Format document content
-                formatted_doc = {
-                    'title': doc.get('title', 'Untitled'),
-                    'content': doc.get('content', '').strip(),
-                    'url': doc.get('url', [''])[0] if isinstance(doc.get('url', []), list) else doc.get('url', '')
-                }
-                
-                # Only include if there's content
-                if formatted_doc['content']:
-                    formatted_docs.append(formatted_doc)
-                    if formatted_doc['url']:
-                        urls.append(formatted_doc['url'])
+            formatted_docs, urls = self._format_docs(retrieved_docs)
 
             # Build prompt
             prompt = self._build_prompt(query, formatted_docs, description)
@@ -168,22 +120,11 @@ class NovaChat(BedrockModel):
                 modelId=self.model_id,
                 contentType="application/json",
                 accept="application/json",
-                body=json.dumps({
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [{"text": prompt}]
-                        }
-                    ],
-                    "inferenceConfig": {
-                        "maxTokens": max_tokens,
-                        "temperature": temperature
-                    }
-                })
+                body=orjson.dumps(self._build_payload(prompt, max_tokens, temperature))
             )
             
             # Parse response
-            response_body = json.loads(response['body'].read())
+            response_body = orjson.loads(response['body'].read())
             generated_text = response_body['output']['message']['content'][0]['text']
             
             # Return response and citations
@@ -193,35 +134,144 @@ class NovaChat(BedrockModel):
             logger.error(f"Error in chat generation: {str(e)}")
             raise
 
+    async def nova_chat_stream(
+            self,
+            query: str,
+            retrieved_docs: List[Dict],
+            description: str = None,
+            max_tokens: int = 1000,
+            temperature: float = 0.7,
+            citations: Optional[List[str]] = None
+        ) -> AsyncGenerator[str, None]:
+        """
+        Stream a response from Nova, yielding text chunks as Bedrock produces them.
+        
+        Args:
+            query (str): User's query
+            retrieved_docs (List[Dict]): List of relevant documents
+            description (str, optional): Additional context or instructions
+            max_tokens (int): Maximum tokens in output
+            temperature (float): Controls randomness
+            citations (List[str], optional): Filled with the citation URLs before
+                the first chunk is yielded
+            
+        Yields:
+            str: Response text deltas
+        """
+        try:
+            formatted_docs, urls = self._format_docs(retrieved_docs)
+            if citations is not None:
+                citations.extend(urls[:5])  # Limit to top 5 citations
+
+            prompt = self._build_prompt(query, formatted_docs, description)
+
+            async with self._bedrock_client() as bedrock:
+                response = await bedrock.invoke_model_with_response_stream(
+                    modelId=self.model_id,
+                    contentType="application/json",
+                    accept="application/json",
+                    body=orjson.dumps(self._build_payload(prompt, max_tokens, temperature))
+                )
+                async for event in response['body']:
+                    chunk = event.get('chunk')
+                    if not chunk:
+                        continue
+                    event_json = orjson.loads(chunk['bytes'])
+                    text = event_json.get('contentBlockDelta', {}).get('delta', {}).get('text')
+                    if text:
+                        yield text
+
+        except Exception as e:
+            logger.error(f"Error in streaming chat generation: {str(e)}")
+            raise
+
+    async def nova_chat_async(
+            self,
+            query: str,
+            retrieved_docs: List[Dict],
+            description: str = None,
+            max_tokens: int = 1000,
+            temperature: float = 0.7
+        ) -> Tuple[str, List[str]]:
+        """Non-streaming wrapper around nova_chat_stream that returns the full response."""
+        citations: List[str] = []
+        chunks = [
+            chunk async for chunk in self.nova_chat_stream(
+                query, retrieved_docs, description, max_tokens, temperature, citations=citations
+            )
+        ]
+        return "".join(chunks), citations
+
+    def _format_docs(self, retrieved_docs: List[Dict]) -> Tuple[List[Dict], List[str]]:
+        """Format documents for the prompt and collect their URLs for citation."""
+        formatted_docs = []
+        urls = []  # Track URLs for citation
+        
+        for doc in retrieved_docs:
+            if not doc.get('content'):
+                continue
+                
+            # Format document content
+            formatted_doc = {
+                'title': doc.get('title', 'Untitled'),
+                'content': doc.get('content', '').strip(),
+                'url': first_url(doc.get('url', ''))
+            }
+            
+            # Only include if there's content
+            if formatted_doc['content']:
+                formatted_docs.append(formatted_doc)
+                if formatted_doc['url']:
+                    urls.append(formatted_doc['url'])
+
+        return formatted_docs, urls
+
+    def _build_payload(self, prompt: str, max_tokens: int, temperature: float) -> Dict:
+        """Build the Bedrock request body for a single-turn prompt."""
+        return {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [{"text": prompt}]
+                }
+            ],
+            "inferenceConfig": {
+                "maxTokens": max_tokens,
+                "temperature": temperature
+            }
+        }
+
     def _build_prompt(self, query: str, docs: List[Dict], description: str = None) -> str:
         """Build the prompt for Nova using query and documents."""
-        # Start with base instructions
-        prompt = [
-            "You are a helpful climate science expert. Answer the question based ONLY on the provided content.",
-            "Be direct, accurate, and focused on climate topics.",
-            "If information is insufficient, say so rather than speculating."
-        ]
+        docs = trim_docs_to_budget(docs, query)
+        buf = io.StringIO()
+        buf.write(_PROMPT_HEADER)
         
         # Add custom description if provided
         if description:
-            prompt.append(description)
+            buf.write("\n")
+            buf.write(description)
             
-        # Add query
-        prompt.append(f"\nQuestion: {query}")
-        
-        # Add document content
-        prompt.append("\nHere are relevant sources to answer from:")
+        # Add query and document content
+        buf.write("\n\nQuestion: ")
+        buf.write(query)
+        buf.write("\n\nHere are relevant sources to answer from:")
         
         for i, doc in enumerate(docs, 1):
-            prompt.append(f"\nSource {i}:")
+            buf.write("\n\nSource ")
+            buf.write(str(i))
+            buf.write(":")
             if doc.get('title'):
-                prompt.append(f"Title: {doc['title']}")
-            prompt.append(f"Content: {doc['content']}\n")
+                buf.write("\nTitle: ")
+                buf.write(doc['title'])
+            buf.write("\nContent: ")
+            buf.write(doc['content'])
+            buf.write("\n")
             
         # Add final instruction
-        prompt.append("\nProvide a clear, factual answer using only the information from these sources.")
+        buf.write(_PROMPT_FOOTER)
         
-        return "\n".join(prompt)
+        return buf.getvalue()
 
 # Test code
 if __name__ == "__main__":
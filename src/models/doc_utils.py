@@ -0,0 +1,219 @@
+"""
+Shared document preprocessing for the generation modules
+"""
+import os
+import re
+import math
+import logging
+import functools
+from collections import Counter
+from typing import List, Dict, Optional, TypedDict, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# Escaped newlines/quotes left over from ingestion, cleaned in a single pass
+_CLEAN_RE = re.compile(r'\\n|\\"')
+_CLEAN_MAP = {'\\n': ' ', '\\"': '"'}
+
+# Input budget for document text in a generation prompt, in approximate tokens
+DOC_TOKEN_BUDGET = int(os.getenv('NOVA_DOC_TOKEN_BUDGET', '4000'))
+# Per-document cap within that budget (~3000 characters), so one long chunk
+# cannot take the share left over by short ones
+DOC_MAX_TOKENS = int(os.getenv('NOVA_DOC_MAX_TOKENS', '750'))
+CHARS_PER_TOKEN = 4
+
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+_TERM_RE = re.compile(r'\w+')
+
+class ProcessedDoc(TypedDict, total=False):
+    """A document as returned by preprocess_docs; 'snippet' only with include_snippet."""
+    title: str
+    url: str
+    content: str
+    snippet: str
+
+class DocRecord(NamedTuple):
+    """
+    Compact, immutable form of a ProcessedDoc for long-lived caches.
+
+    About half the size of the dict, and a tuple of strings is dropped from
+    garbage-collector tracking, so cached document sets add no GC scan work.
+    """
+    title: str
+    url: str
+    content: str
+    snippet: str
+
+    @classmethod
+    def from_doc(cls, doc: ProcessedDoc) -> 'DocRecord':
+        content = doc['content']
+        snippet = doc.get('snippet')
+        return cls(doc['title'], doc['url'], content, _make_snippet(content) if snippet is None else snippet)
+
+    def as_doc(self) -> ProcessedDoc:
+        return {'title': self.title, 'url': self.url, 'content': self.content, 'snippet': self.snippet}
+
+def _clean_escape(match) -> str:
+    return _CLEAN_MAP[match.group(0)]
+
+@functools.lru_cache(maxsize=8192)
+def clean_content(content: str) -> str:
+    """Clean raw document content; memoized since the same sources are retrieved repeatedly."""
+    return _CLEAN_RE.sub(_clean_escape, content).strip()
+
+def first_url(url) -> str:
+    """Return a single URL string from a url field that may be a list or a string."""
+    if isinstance(url, str):
+        return url
+    if isinstance(url, list) and url:
+        return url[0]
+    return ''
+
+def _make_snippet(content: str) -> str:
+    return content[:200] + '...' if len(content) > 200 else content
+
+def preprocess_docs(docs: List[Dict], include_snippet: bool = False) -> List[ProcessedDoc]:
+    """
+    Validate and clean retrieved documents.
+
+    Args:
+        docs (list): List of document dictionaries
+        include_snippet (bool): Add a 200-character 'snippet' field to each document
+
+    Returns:
+        list: Documents with 'title', 'url' and cleaned 'content' fields
+    """
+    logger.debug("Processing %d documents", len(docs))
+    documents = []
+    # Checked once rather than per document
+    debug = logger.isEnabledFor(logging.DEBUG)
+    seen = set()
+    for doc in docs:
+        try:
+            # Extract required fields
+            title = doc.get('title', '')
+            content = doc.get('content', '')  # Primary content field
+            if not content:
+                content = doc.get('chunk_text', '')  # Fallback content field
+
+            # Validation
+            if not title or not content:
+                logger.warning(f"Missing required fields - Title: {bool(title)}, Content: {bool(content)}")
+                continue
+
+            # Overlapping chunks of the same source add prompt tokens, not information
+            url = first_url(doc.get('url', ''))
+            if (title, url) in seen:
+                continue
+            seen.add((title, url))
+
+            # Clean content
+            content = clean_content(content)
+            if len(content) < 10:
+                logger.warning(f"Content too short for document: {title}")
+                continue
+
+            document = {
+                'title': title,
+                'url': url,
+                'content': content
+            }
+            if include_snippet:
+                document['snippet'] = _make_snippet(content)
+
+            if debug:
+                logger.debug("Processed document - Title: %s, content length: %d", title, len(content))
+
+            documents.append(document)
+
+        except (KeyError, AttributeError, TypeError) as e:
+            # Malformed document (not a dict, or non-string fields)
+            logger.error(f"Error processing document: {str(e)}")
+            continue
+
+    if documents:
+        logger.info(f"Successfully processed {len(documents)} documents")
+    else:
+        logger.error("No documents were successfully processed")
+
+    return documents
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count; Nova's tokenizer is not available locally."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _bm25_scores(query_terms: List[str], sentences: List[List[str]], k1: float = 1.5, b: float = 0.75) -> List[float]:
+    """Score each tokenized sentence against the query terms with BM25."""
+    n = len(sentences)
+    avg_len = sum(len(terms) for terms in sentences) / n or 1
+    doc_freq = Counter(term for terms in sentences for term in set(terms))
+    scores = []
+    for terms in sentences:
+        counts = Counter(terms)
+        score = 0.0
+        for term in query_terms:
+            tf = counts.get(term)
+            if not tf:
+                continue
+            idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+            score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(terms) / avg_len))
+        scores.append(score)
+    return scores
+
+def _trim_content(content: str, query_terms: List[str], budget: int) -> str:
+    """Keep the sentences most relevant to the query, in their original order, within budget tokens."""
+    sentences = _SENTENCE_RE.split(content)
+    if len(sentences) == 1:
+        return content[:budget * CHARS_PER_TOKEN]
+    scores = _bm25_scores(query_terms, [_TERM_RE.findall(sentence.lower()) for sentence in sentences])
+    # Highest score first; earlier sentences win ties
+    ranked = sorted(range(len(sentences)), key=lambda i: (-scores[i], i))
+    keep, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i])
+        if used + cost > budget:
+            continue
+        keep.append(i)
+        used += cost
+    if not keep:
+        return sentences[ranked[0]][:budget * CHARS_PER_TOKEN]
+    return " ".join(sentences[i] for i in sorted(keep))
+
+def trim_docs_to_budget(docs: List[Dict], query: str, max_tokens: Optional[int] = None) -> List[Dict]:
+    """
+    Shrink document content so the prompt's document block fits a token budget.
+
+    The budget is split evenly between documents, and an unused share carries
+    over to the documents after it; no document gets more than DOC_MAX_TOKENS.
+    Documents that do not fit their share keep their highest-scoring
+    sentences (BM25 against the query).
+
+    Args:
+        docs (list): Preprocessed documents with a 'content' field
+        query (str): The user's query
+        max_tokens (int, optional): Total budget, defaults to DOC_TOKEN_BUDGET
+
+    Returns:
+        list: Copies of the documents with trimmed 'content'; unchanged documents are passed through
+    """
+    if not docs:
+        return docs
+    budget = DOC_TOKEN_BUDGET if max_tokens is None else max_tokens
+    costs = [estimate_tokens(doc.get('content', '')) for doc in docs]
+    if sum(costs) <= budget and max(costs) <= DOC_MAX_TOKENS:
+        return docs
+
+    query_terms = _TERM_RE.findall(query.lower())
+    trimmed = []
+    for i, doc in enumerate(docs):
+        share = min(budget // (len(docs) - i), DOC_MAX_TOKENS)
+        content = doc.get('content', '')
+        cost = costs[i]
+        if cost > share:
+            content = _trim_content(content, query_terms, share)
+            cost = estimate_tokens(content)
+            doc = {**doc, 'content': content}
+        trimmed.append(doc)
+        budget = max(0, budget - cost)
+    logger.debug(f"Trimmed document block to ~{sum(estimate_tokens(d.get('content', '')) for d in trimmed)} tokens")
+    return trimmed
@@ -1,10 +1,12 @@
-import os
 import logging
-import json
-from typing import List, Dict, Tuple, Any, Optional, Union, AsyncGenerator
+import re
+import hashlib
+import asyncio
+from collections import deque
+from typing import List, Dict, Tuple, Any, Optional, AsyncGenerator, TypedDict
 from src.models.nova_flow import BedrockModel
-from src.models.redis_cache import ClimateCache
-from concurrent.futures import ThreadPoolExecutor
+from src.models.redis_cache import ClimateCache, HotCache
+from src.models.doc_utils import preprocess_docs, trim_docs_to_budget, first_url, ProcessedDoc, DocRecord
 import time
 from langsmith import traceable
 
@@ -16,74 +18,87 @@ from src.models.system_messages import CLIMATE_SYSTEM_MESSAGE
 # Use the imported system message
 system_message = CLIMATE_SYSTEM_MESSAGE
 
-def doc_preprocessing(docs: List[Dict]) -> List[Dict]:
+class CitationDict(TypedDict):
+    """A citation as returned alongside Nova responses."""
+    title: str
+    url: str
+    content: str
+    snippet: str
+
+# Multi-turn chats keep re-sending the same retrieved documents; sets are
+# stored as DocRecord tuples and handed out as fresh dicts
+_PROCESSED_DOCS_CACHE = HotCache(maxsize=256, ttl=3600)
+
+def _docs_fingerprint(docs: List[Dict]) -> str:
+    """Digest of the fields doc_preprocessing reads, in document order."""
+    h = hashlib.blake2b(digest_size=16)
+    for d in docs:
+        for field in (d.get('title', ''), first_url(d.get('url', '')), d.get('content') or d.get('chunk_text') or ''):
+            h.update(str(field).encode('utf-8'))
+            h.update(b'\x1f')
+        h.update(b'\x1e')
+    return h.hexdigest()
+
+def doc_preprocessing(docs: List[Dict]) -> List[ProcessedDoc]:
     """Prepare documents for processing."""
-    documents = []
-    logger.debug(f"Processing {len(docs)} documents")
-    
-    for doc in docs:
-        try:
-            # Extract required fields
-            title = doc.get('title', '')
-            content = doc.get('content', '')  # Primary content field
-            if not content:
-                content = doc.get('chunk_text', '')  # Fallback content field
-                
-            # Get URL(s)
-            url = doc.get('url', [])
-            if isinstance(url, list) and url:
-                url = url[0]
-            elif isinstance(url, str):
-                url = url
-            else:
-                url = ''
-                
-            # Validation
-            if not title or not content:
-                logger.warning(f"Missing required fields - Title: {bool(title)}, Content: {bool(content)}")
-                continue
-                
-            # Clean content
-            content = content.replace('\\n', ' ').replace('\\"', '"').strip()
-            if len(content) < 10:
-                logger.warning(f"Content too short for document: {title}")
-                continue
-                
-            # Format document
-            document = {
-                'title': title,
-                'url': url,
-                'content': content,
-                'snippet': content[:200] + '...' if len(content) > 200 else content
-            }
-            
-            logger.debug(f"Processed document - Title: {title}")
-            logger.debug(f"Content length: {len(content)}")
-            
-            documents.append(document)
-            
-        except Exception as e:
-            logger.error(f"Error processing document: {str(e)}")
-            continue
-    
-    if documents:
-        logger.info(f"Successfully processed {len(documents)} documents")
-    else:
-        logger.error("No documents were successfully processed")
-        
-    return documents
+    fingerprint = _docs_fingerprint(docs)
+    records = _PROCESSED_DOCS_CACHE.get(fingerprint)
+    if records is None:
+        processed = preprocess_docs(docs, include_snippet=True)
+        _PROCESSED_DOCS_CACHE.set(fingerprint, tuple(DocRecord.from_doc(doc) for doc in processed))
+        return processed
+    logger.debug(f"Reusing preprocessed documents for fingerprint {fingerprint}")
+    return [record.as_doc() for record in records]
+
+def _keyed_digest(head: str, docs: List[Dict]) -> str:
+    """blake2b digest of ``head`` followed by each document's title and url, sorted,
+    with \\x1f before each title and \\x1e between title and url."""
+    pairs = sorted((d.get('title', ''), first_url(d.get('url', ''))) for d in docs)
+    # One encode and one hash call over the joined buffer
+    key_text = '\x1f'.join([head, *('\x1e'.join(pair) for pair in pairs)])
+    return hashlib.blake2b(key_text.encode('utf-8'), digest_size=16).hexdigest()
 
 def generate_cache_key(query: str, docs: List[Dict]) -> str:
-    """Generate a unique cache key."""
-    doc_identifiers = sorted([
-        f"{d.get('title', '')}:{d.get('url', '')}"
-        for d in docs
-    ])
-    doc_key = hash(tuple(doc_identifiers))
-    query_key = hash(query.lower().strip())
-    return f"nova_response:{query_key}:{doc_key}"
-
-async def nova_chat(query, documents, nova_model, description=None, conversation_history=None):
+    """Generate a unique cache key that is stable across worker processes.
+    
+    The key is a digest of the normalized query and the documents' titles and urls.
+    """
+    return f"nova_response:{_keyed_digest(query.lower().strip(), docs)}"
+
+def generate_batch_cache_key(query: str, docs: List[Dict]) -> str:
+    """Cache key for an answer from a batched prompt, kept apart from nova_chat's
+    generate_cache_key entries so single requests never get a batch answer."""
+    return f"nova_batch_response:{_keyed_digest(query.lower().strip(), docs)}"
+
+def _semantic_scope(docs: List[Dict], description: Optional[str]) -> str:
+    """Semantic cache scope: a paraphrase only reuses an answer generated from the
+    same documents, identified as in generate_cache_key, and the same description."""
+    return _keyed_digest(description or '', docs)
+
+# Module-level handle on the ClimateCache singleton, created on first use
+_CACHE = None
+
+def _get_cache():
+    """Return the shared cache without re-entering the singleton lock on every request."""
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = ClimateCache()
+    return _CACHE
+
+# (cache_key, description) -> (event loop, future) for generations in progress
+_INFLIGHT: Dict[Tuple[str, Optional[str]], Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+
+# Strong references to in-flight cache writes so they are not garbage collected
+_BACKGROUND_TASKS = set()
+
+def _cache_in_background(cache, key: str, value: Dict) -> None:
+    """Write to Redis without holding up the response; ClimateCache.set logs its own failures."""
+    task = asyncio.create_task(cache.set(key, value))
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+
+@traceable(name="nova_response_generation")
+async def nova_chat(query, documents, nova_model, description=None, conversation_history=None, query_embedding=None):
     """
     Generate a response from Nova model using a query and retrieved documents.
     
@@ -92,152 +107,407 @@ async def nova_chat(query, documents, nova_model, description=None, conversation
         documents (list): List of documents from retrieval
         nova_model (object): Initialized Nova model
         description (str, optional): Description to include in the prompt
-        conversation_history (list, optional): Conversation history for context
+        conversation_history (list or deque, optional): Conversation history for context;
+            a deque(maxlen=MAX_HISTORY_TURNS) is used as-is
+        query_embedding (array-like, optional): Dense query embedding, e.g. the one
+            retrieval searched with; enables the semantic cache for standalone (no
+            conversation history) queries over the same documents and description
         
     Returns:
         tuple: (response, citations)
     """
+    prep_task = None
     try:
-        from langsmith import trace
+        logger.info("Starting nova_chat response generation")
         
-        with trace(name="nova_response_generation"):
-            logger.info("Starting nova_chat response generation")
-            
-            if not documents:
-                logger.warning("No documents were provided for processing")
-                # Instead of raising an error, let's try to generate a response based just on conversation history
-                if conversation_history:
-                    logger.info("Attempting to generate response using only conversation history")
-                    # Create a minimal document with conversation summary
-                    documents = [
-                        {
-                            'title': 'Conversation Context',
-                            'content': 'This response is based on previous conversation context.',
-                            'url': ''
-                        }
-                    ]
-                else:
-                    logger.error("No documents and no conversation history available")
-                    raise ValueError("No valid documents to process")
+        if not documents:
+            logger.warning("No documents were provided for processing")
+            # Instead of raising an error, let's try to generate a response based just on conversation history
+            if conversation_history:
+                logger.info("Attempting to generate response using only conversation history")
+                documents = []
+            else:
+                logger.error("No documents and no conversation history available")
+                raise ValueError("No valid documents to process")
 
-            # Generate cache key based on query and documents
-            cache_key = generate_cache_key(query, documents)
+        # Generate cache key based on query and documents
+        cache_key = generate_cache_key(query, documents)
+        
+        # Try to get cached response, from the in-process tier without a Redis round trip first;
+        # cache.get falls back to a miss by itself when Redis is unavailable
+        cache = _get_cache()
+        cached_result = cache.get_local(cache_key)
+        if cached_result is None:
+            # Preprocess documents off the event loop while the Redis lookup is in flight;
+            # the conversation-only path has nothing to preprocess
+            if documents:
+                prep_task = asyncio.create_task(asyncio.to_thread(doc_preprocessing, documents))
+            try:
+                cached_result = await cache.get(cache_key)
+            except Exception as e:
+                logger.error(f"Error retrieving from cache: {str(e)}")
+        if cached_result:
+            logger.info("Cache hit - returning cached response")
+            return cached_result.get('response'), cached_result.get('citations', [])
+        
+        # Paraphrase lookup; follow-ups depend on history so they are never shared
+        use_semantic_cache = query_embedding is not None and not conversation_history
+        if use_semantic_cache:
+            semantic_scope = _semantic_scope(documents, description)
+            semantic_hit = cache.semantic_get(query_embedding, scope=semantic_scope)
+            if semantic_hit:
+                logger.info("Semantic cache hit - returning cached response")
+                return semantic_hit
+        
+        # Single-flight: identical standalone requests already generating on this
+        # event loop share that result instead of calling Nova again
+        loop = asyncio.get_running_loop()
+        flight_key = (cache_key, description) if not conversation_history else None
+        while flight_key:
+            flight = _INFLIGHT.get(flight_key)
+            if flight is None or flight[0] is not loop:
+                break
+            logger.info("Identical request in flight - awaiting its response")
+            try:
+                return await asyncio.shield(flight[1])
+            except asyncio.CancelledError:
+                # Only the leader's own cancellation is ours to recover from; take
+                # over the generation (or follow whoever already has)
+                if not flight[1].cancelled():
+                    raise
+                logger.info("In-flight request was cancelled - generating the response here")
+        leader = None
+        if flight_key:
+            leader = loop.create_future()
+            _INFLIGHT[flight_key] = (loop, leader)
+        
+        try:
+            processed_docs = await prep_task if prep_task is not None else None
             
-            # Try to get cached response
-            cache = ClimateCache()
-            if cache.redis_client:
-                try:
-                    cached_result = await cache.get(cache_key)
-                    if cached_result:
-                        logger.info("Cache hit - returning cached response")
-                        return cached_result.get('response'), cached_result.get('citations', [])
-                except Exception as e:
-                    logger.error(f"Error retrieving from cache: {str(e)}")
+            # Process documents for generation
+            response, citations = await _process_documents_and_generate(
+                query=query,
+                documents=documents,
+                nova_model=nova_model,
+                description=description,
+                conversation_history=conversation_history,
+                processed_docs=processed_docs
+            )
             
+            # Cache the result; the in-process tier keeps it even when Redis is unavailable
             try:
-                # Process documents for generation
-                with trace(name="document_processing"):
-                    response, citations = await _process_documents_and_generate(
-                        query=query,
-                        documents=documents,
-                        nova_model=nova_model,
-                        description=description,
-                        conversation_history=conversation_history
-                    )
-                    
-                # Cache the result if cache is available
-                if cache.redis_client:
-                    try:
-                        cache_data = {
-                            'response': response,
-                            'citations': citations
-                        }
-                        await cache.set(cache_key, cache_data)
-                        logger.info("Response cached successfully")
-                    except Exception as e:
-                        logger.error(f"Error caching response: {str(e)}")
-                
-                logger.info("Response generation complete")
-                return response, citations
-                
+                cache_data = {
+                    'response': response,
+                    'citations': citations
+                }
+                _cache_in_background(cache, cache_key, cache_data)
             except Exception as e:
-                logger.error(f"Error in nova_chat: {str(e)}")
-                raise
+                logger.error(f"Error caching response: {str(e)}")
+            if use_semantic_cache:
+                cache.semantic_put(query_embedding, response, citations, scope=semantic_scope)
+            
+            logger.info("Response generation complete")
+            if leader is not None:
+                leader.set_result((response, citations))
+            return response, citations
+            
+        except BaseException as e:
+            if leader is not None and not leader.done():
+                if isinstance(e, asyncio.CancelledError):
+                    leader.cancel()
+                else:
+                    leader.set_exception(e)
+                    # Followers re-raise it; mark it retrieved in case there are none
+                    leader.exception()
+            raise
+        finally:
+            if flight_key and _INFLIGHT.get(flight_key, (None, None))[1] is leader:
+                del _INFLIGHT[flight_key]
     except Exception as e:
         logger.error(f"Error in nova_chat: {str(e)}")
         raise
+    finally:
+        # Unused after a cache hit or an early error: stop it, or mark its failure retrieved
+        if prep_task is not None:
+            if not prep_task.done():
+                prep_task.cancel()
+            elif not prep_task.cancelled():
+                prep_task.exception()
+
+# Conversation history contract: callers build the history in a
+# collections.deque(maxlen=MAX_HISTORY_TURNS), which bounds it on append; plain
+# lists longer than that are cut to the last TRUNCATED_HISTORY_TURNS messages.
+MAX_HISTORY_TURNS = 10
+TRUNCATED_HISTORY_TURNS = 6
 
+async def _prepare_generation_inputs(
+    documents: List[Dict[str, Any]],
+    conversation_history: list = None,
+    processed_docs: Optional[List[Dict]] = None
+) -> Tuple[List[Dict], Optional[list]]:
+    """Preprocess documents and trim conversation history for a Nova generation call."""
+    # Preprocess documents unless the caller already did
+    if processed_docs is None:
+        processed_docs = await asyncio.to_thread(doc_preprocessing, documents) if documents else []
+    if not processed_docs:
+        logger.warning("Document preprocessing returned no valid documents")
+        # With conversation history Nova can still answer from the history alone
+        if conversation_history:
+            logger.info("Generating conversation-based response without documents")
+        else:
+            raise ValueError("No valid documents to process")
+    
+    logger.info(f"Successfully processed {len(processed_docs)} documents")
+    
+    if isinstance(conversation_history, deque):
+        # Already bounded by the caller's maxlen; the prompt builder indexes a list
+        conversation_history = list(conversation_history)
+    elif conversation_history and len(conversation_history) > MAX_HISTORY_TURNS:
+        # Unbounded list: keep only the most recent turns
+        logger.info(f"Conversation history too long, keeping only the most recent {TRUNCATED_HISTORY_TURNS} turns")
+        conversation_history = conversation_history[-TRUNCATED_HISTORY_TURNS:]
+    if conversation_history:
+        logger.info(f"Using conversation history: {len(conversation_history)} turns")
+    
+    return processed_docs, conversation_history
+
+def _build_citations(processed_docs: List[ProcessedDoc]) -> List[CitationDict]:
+    """Extract citations with full document details."""
+    # doc_preprocessing guarantees str fields and a precomputed snippet
+    citations = []
+    for doc in processed_docs:
+        content = doc['content']
+        snippet = doc.get('snippet')
+        if snippet is None:
+            snippet = content[:200] + '...' if len(content) > 200 else content
+        citations.append({'title': doc['title'], 'url': doc['url'], 'content': content, 'snippet': snippet})
+    return citations
+
+@traceable(name="document_processing")
 async def _process_documents_and_generate(
     query: str,
     documents: List[Dict[str, Any]],
     nova_model,
     description: str = None,
-    conversation_history: list = None
-) -> Tuple[str, List[Dict[str, str]]]:
+    conversation_history: list = None,
+    processed_docs: Optional[List[Dict]] = None
+) -> Tuple[str, List[CitationDict]]:
     """Process documents and generate a response using Nova with improved multi-turn conversation handling."""
     try:
-        # Preprocess documents
-        processed_docs = doc_preprocessing(documents)
-        if not processed_docs:
-            logger.warning("Document preprocessing returned no valid documents")
-            # If we have conversation history, create a synthetic document to avoid errors
-            if conversation_history:
-                logger.info("Creating minimal document for conversation-based response")
-                processed_docs = [{
-                    'title': 'Conversation Context',
-                    'content': 'Response based on previous conversation.',
-                    'url': '',
-                    'snippet': 'Response based on previous conversation.'
-                }]
-            else:
-                raise ValueError("No valid documents to process")
-        
-        logger.info(f"Successfully processed {len(processed_docs)} documents")
-        
-        # If we have conversation history, check if we should prioritize the most recent context
-        if conversation_history and len(conversation_history) > 1:
-            # For now, let's keep all conversation history to ensure context is preserved
-            # The relevance optimization was being too aggressive and removing important context
-            logger.info(f"Using full conversation history: {len(conversation_history)} turns")
-            
-            # Only keep the most recent conversation if we have too many turns (>10)
-            if len(conversation_history) > 10:
-                logger.info("Conversation history too long, keeping only the most recent 6 turns")
-                conversation_history = conversation_history[-6:]
+        processed_docs, conversation_history = await _prepare_generation_inputs(
+            documents, conversation_history, processed_docs
+        )
         
         # Generate response with Nova, now passing optimized conversation_history
         response = await nova_model.generate_response(
             query=query,
-            documents=processed_docs,
+            documents=trim_docs_to_budget(processed_docs, query),
             description=description,
             conversation_history=conversation_history
         )
         
-        # Extract citations with full document details
-        citations = []
-        for doc in processed_docs:
-            # Only include real citations (skip synthetic conversation context docs)
-            if doc.get('title') != 'Conversation Context' or doc.get('url'):
-                # Format citation with all required fields
-                citation = {
-                    'title': str(doc.get('title', 'Untitled Source')),
-                    'url': str(doc.get('url', '')),
-                    'content': str(doc.get('content', '')),
-                    'snippet': str(doc.get('snippet', doc.get('content', '')[:200] + '...' if doc.get('content') else ''))
-                }
-                citations.append(citation)
-        
-        return response, citations
+        return response, _build_citations(processed_docs)
         
     except Exception as e:
         logger.error(f"Error processing documents: {str(e)}")
         raise
 
-async def process_batch_queries(queries: List[str], documents: List[Dict], nova_client) -> List[str]:
-    """Process multiple queries in parallel using asyncio.gather"""
-    tasks = [nova_chat(query, documents, nova_client) for query in queries]
-    results = await asyncio.gather(*tasks)
-    return [response for response, _ in results]
+async def nova_chat_events(
+    query: str,
+    documents: List[Dict[str, Any]],
+    nova_model,
+    description: str = None,
+    conversation_history: list = None
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Stream a response from Nova as typed events.
+    
+    Citations come from the preprocessed documents and are known before
+    generation starts, so they are yielded first as
+    {"type": "citations", "data": [...]}; the answer follows as
+    {"type": "text_chunk", "data": "..."} events. Cache hits yield the same
+    two event types with the full cached text in one chunk.
+    """
+    if not documents and not conversation_history:
+        raise ValueError("No valid documents to process")
+    
+    cache_key = generate_cache_key(query, documents)
+    cache = _get_cache()
+    try:
+        cached_result = await cache.get(cache_key)
+        if cached_result:
+            logger.info("Cache hit - streaming cached response")
+            yield {"type": "citations", "data": cached_result.get('citations', [])}
+            yield {"type": "text_chunk", "data": cached_result.get('response')}
+            return
+    except Exception as e:
+        logger.error(f"Error retrieving from cache: {str(e)}")
+    
+    try:
+        processed_docs, conversation_history = await _prepare_generation_inputs(
+            documents, conversation_history
+        )
+        citations = _build_citations(processed_docs)
+        yield {"type": "citations", "data": citations}
+        
+        chunks = []
+        async for chunk in nova_model.generate_response_stream(
+            query=query,
+            documents=trim_docs_to_budget(processed_docs, query),
+            description=description,
+            conversation_history=conversation_history
+        ):
+            chunks.append(chunk)
+            yield {"type": "text_chunk", "data": chunk}
+    except Exception as e:
+        logger.error(f"Error in nova_chat_events: {str(e)}")
+        raise
+    
+    try:
+        _cache_in_background(cache, cache_key, {'response': "".join(chunks), 'citations': citations})
+    except Exception as e:
+        logger.error(f"Error caching response: {str(e)}")
+
+async def nova_chat_stream(
+    query: str,
+    documents: List[Dict[str, Any]],
+    nova_model,
+    description: str = None,
+    conversation_history: list = None,
+    citations: Optional[List[CitationDict]] = None
+) -> AsyncGenerator[str, None]:
+    """
+    Stream the response text from Nova as it is generated.
+
+    Text-only counterpart of nova_chat: the first token reaches the caller as
+    soon as Nova emits it, and the assembled response is cached at stream end.
+
+    Args:
+        citations (list, optional): Filled with the citations before the first
+            text chunk is yielded
+    """
+    async for event in nova_chat_events(query, documents, nova_model, description, conversation_history):
+        if event["type"] == "citations":
+            if citations is not None:
+                citations.extend(event["data"])
+        else:
+            yield event["data"]
+
+# Batched generation: one Nova call answers several questions over shared documents
+BATCH_TOKENS_PER_QUERY = 800
+BATCH_MAX_TOKENS = 10000
+# Cap on concurrent Bedrock calls from one batch, to stay inside Nova's rate limits
+BATCH_MAX_CONCURRENCY = 16
+_BATCH_ANSWER_RE = re.compile(r'^\s*#{0,3}\s*\[ANSWER (\d+)\]\s*$', re.MULTILINE)
+
+def _build_batch_prompt(queries: List[str], processed_docs: List[Dict]) -> str:
+    """Build one prompt that shares the document block across all questions."""
+    formatted_docs = "\n\n".join(
+        f"Document {i+1}:\n{doc.get('content', '')}"
+        for i, doc in enumerate(processed_docs)
+    )
+    questions = "\n".join(f"Q{i+1}: {query}" for i, query in enumerate(queries))
+    return f"""Documents for context:
+{formatted_docs}
+
+Answer each question below separately, using the documents above.
+Start each answer on its own line with the marker [ANSWER n], where n is the question number, and do not write anything before the first marker.
+
+{questions}"""
+
+def _split_batch_answers(text: str, count: int) -> List[Optional[str]]:
+    """Split a batched completion on its [ANSWER n] markers; missing answers are None."""
+    answers: List[Optional[str]] = [None] * count
+    markers = list(_BATCH_ANSWER_RE.finditer(text))
+    for i, marker in enumerate(markers):
+        index = int(marker.group(1)) - 1
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        answer = text[marker.end():end].strip()
+        if 0 <= index < count and answer:
+            answers[index] = answer
+    return answers
+
+async def nova_chat_batch(
+    queries: List[str],
+    documents: List[Dict],
+    nova_model,
+    processed_docs: Optional[List[Dict]] = None
+) -> List[Optional[str]]:
+    """
+    Answer several queries over the same documents with as few Nova calls as possible.
+    
+    The document context is sent once per group of queries instead of once per
+    query. Any answer the model fails to delimit, or whose group call failed,
+    is regenerated individually through nova_chat; queries that still fail are
+    returned as None. At most BATCH_MAX_CONCURRENCY Nova calls run at once.
+    Pass ``processed_docs`` when the documents were already preprocessed.
+    """
+    if not queries:
+        return []
+    if processed_docs is None:
+        processed_docs = await asyncio.to_thread(doc_preprocessing, documents)
+    if not processed_docs:
+        raise ValueError("No valid documents to process")
+
+    group_size = max(1, BATCH_MAX_TOKENS // BATCH_TOKENS_PER_QUERY)
+    groups = [queries[i:i + group_size] for i in range(0, len(queries), group_size)]
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def _answer_group(group: List[str]) -> List[Optional[str]]:
+        async with semaphore:
+            text = await nova_model.nova_content_generation(
+                _build_batch_prompt(group, processed_docs),
+                system_message=system_message,
+                max_tokens=len(group) * BATCH_TOKENS_PER_QUERY
+            )
+        return _split_batch_answers(text, len(group))
+
+    async def _answer_one(query: str) -> str:
+        async with semaphore:
+            response, _ = await nova_chat(query, documents, nova_model)
+        return response
+
+    answers: List[Optional[str]] = []
+    grouped_answers = await asyncio.gather(*(_answer_group(group) for group in groups), return_exceptions=True)
+    for group, result in zip(groups, grouped_answers):
+        if isinstance(result, Exception):
+            logger.error(f"Batched generation failed for {len(group)} queries: {str(result)}")
+            result = [None] * len(group)
+        answers.extend(result)
+
+    missing = [i for i, answer in enumerate(answers) if answer is None]
+    if missing:
+        logger.warning(f"Batched generation missed {len(missing)} answers, regenerating individually")
+        retried = await asyncio.gather(*(_answer_one(queries[i]) for i in missing), return_exceptions=True)
+        for i, result in zip(missing, retried):
+            if isinstance(result, Exception):
+                logger.error(f"Error generating answer for batched query: {str(result)}")
+                continue
+            answers[i] = result
+    return answers
+
+async def process_batch_queries(queries: List[str], documents: List[Dict], nova_client) -> List[Optional[str]]:
+    """Process multiple queries against shared documents using batched Nova calls; failed queries are None"""
+    cache = _get_cache()
+    keys = [generate_batch_cache_key(query, documents) for query in queries]
+    
+    # One MGET round-trip for every query, then generate only the misses
+    cached = await cache.get_many(keys)
+    results = [entry.get('response') if entry else None for entry in cached]
+    missing = [i for i, response in enumerate(results) if response is None]
+    logger.info(f"Batch cache lookup: {len(queries) - len(missing)}/{len(queries)} hits")
+    if not missing:
+        return results
+    
+    processed_docs = await asyncio.to_thread(doc_preprocessing, documents)
+    answers = await nova_chat_batch([queries[i] for i in missing], documents, nova_client, processed_docs)
+    citations = _build_citations(processed_docs)
+    for i, answer in zip(missing, answers):
+        results[i] = answer
+        if answer is not None:
+            _cache_in_background(cache, keys[i], {'response': answer, 'citations': citations})
+    return results
 
 if __name__ == "__main__":
     start_time = time.time()
@@ -262,7 +532,6 @@ if __name__ == "__main__":
     query = "What is climate change?"
     
     try:
-        import asyncio
         response, citations = asyncio.run(nova_chat(query, test_docs, nova_client))
         print("\nResponse:", response)
         print("\nCitations:", citations)
@@ -1,11 +1,14 @@
 import os
-import json
+import hashlib
 import logging
+import time
 import asyncio
+import weakref
 from typing import List, Dict, Union, Optional
 from src.utils.env_loader import load_environment
-from src.models.nova_flow import BedrockModel
+from src.models.redis_cache import HotCache
 import cohere
+import httpx
 from langsmith import traceable
 
 # Configure logging
@@ -15,124 +18,249 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_or_create_event_loop():
-    """Get the current event loop or create a new one."""
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    return loop
+# Keep-alive limits for Cohere, so repeated checks reuse the TCP/TLS connection
+_COHERE_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=30.0)
+# httpx async connection pools are tied to the event loop they were opened on;
+# loop -> {api_key: (Cohere client, its httpx client)}
+_ASYNC_COHERE_CLIENTS = weakref.WeakKeyDictionary()
+
+def _get_cohere_client(api_key: str) -> cohere.AsyncClient:
+    """Return the Cohere client shared by all checks on the running event loop."""
+    clients = _ASYNC_COHERE_CLIENTS.setdefault(asyncio.get_running_loop(), {})
+    entry = clients.get(api_key)
+    if entry is None:
+        http_client = httpx.AsyncClient(limits=_COHERE_LIMITS)
+        entry = clients[api_key] = (cohere.AsyncClient(api_key=api_key, httpx_client=http_client), http_client)
+    return entry[0]
+
+async def close_cohere_clients() -> None:
+    """Close the Cohere connection pools opened on the running event loop.
+
+    Call before the loop is shut down; a later check on the same loop opens a new pool.
+    """
+    clients = _ASYNC_COHERE_CLIENTS.pop(asyncio.get_running_loop(), {})
+    for _, http_client in clients.values():
+        try:
+            await http_client.aclose()
+        except Exception as e:
+            logger.warning(f"Error closing Cohere connection pool: {str(e)}")
+
+# Rerank fallbacks for the same question submitted in one loop iteration share one Cohere call
+RERANK_BATCH_MAX_CHECKS = 32
+
+class _BatchedReranker:
+    """
+    Coalesces concurrent rerank calls for the same question into one request.
+
+    Each submit() adds its documents to the open batch for (client, question)
+    on the running loop; the batch is sent on the next loop iteration, so a lone
+    check waits for nothing and checks started together (e.g. by gather) share
+    one request. Every caller gets the relevance scores of its own documents,
+    in order. Rerank scores each document against the query independently, so
+    batching does not change them.
+    """
+
+    def __init__(self, max_checks: int = RERANK_BATCH_MAX_CHECKS):
+        self.max_checks = max_checks
+        self._pending: Dict[tuple, list] = {}
+        # Strong references to scheduled flushes so they are not garbage collected
+        self._tasks = set()
+
+    async def submit(self, client, question: str, documents: List[Dict]) -> List[float]:
+        loop = asyncio.get_running_loop()
+        key = (loop, client, question)
+        batch = self._pending.get(key)
+        if batch is None:
+            batch = self._pending[key] = []
+            loop.call_soon(self._schedule_flush, loop, key, batch)
+        future = loop.create_future()
+        batch.append((documents, future))
+        if len(batch) >= self.max_checks:
+            # Full: later arrivals open a new batch; this one still flushes as scheduled
+            del self._pending[key]
+        return await future
+
+    def _schedule_flush(self, loop, key: tuple, batch: list) -> None:
+        if self._pending.get(key) is batch:
+            del self._pending[key]
+        task = loop.create_task(self._flush(key[1], key[2], batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, client, question: str, batch: list) -> None:
+        documents = [doc for docs, _ in batch for doc in docs]
+        try:
+            result = await client.rerank(
+                query=question,
+                documents=documents,
+                top_n=len(documents),
+                model="rerank-english-v3.0"
+            )
+            scores = [0.0] * len(documents)
+            for r in result.results:
+                scores[r.index] = r.relevance_score
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if len(batch) > 1:
+            logger.debug(f"Coalesced {len(batch)} rerank calls into one request")
+        offset = 0
+        for docs, future in batch:
+            if not future.done():
+                future.set_result(scores[offset:offset + len(docs)])
+            offset += len(docs)
+
+_RERANKER = _BatchedReranker()
+
+# The SDK/account may not offer grounding; after it is found missing, go straight
+# to rerank and only re-probe grounding every GROUNDING_REPROBE_INTERVAL seconds
+GROUNDING_REPROBE_INTERVAL = 600
+_grounding_retry_at = 0.0
+
+def _grounding_unavailable(error: Exception) -> bool:
+    """True for errors meaning grounding does not exist, as opposed to a failed request."""
+    return isinstance(error, AttributeError) or getattr(error, 'status_code', None) == 404
+
+# Faithfulness scores of recent (question, answer, context) checks; failures are not cached
+_SCORE_CACHE = HotCache(maxsize=4096, ttl=3600)
+
+def _score_key(question: str, answer: str, context: str) -> bytes:
+    return hashlib.blake2b('\0'.join((question, answer, context)).encode('utf-8'), digest_size=16).digest()
 
 def truncate_text(text: str, max_length: int = 450) -> str:
     """Truncate text to a maximum number of words while preserving meaning."""
-    words = text.split()
+    # Split off at most max_length words; anything past them stays in one tail string
+    words = text.split(None, max_length)
     return ' '.join(words[:max_length]) + '...' if len(words) > max_length else text
 
+# Contexts whose word-trigram sets overlap more than this are treated as duplicates
+NEAR_DUPLICATE_JACCARD = 0.85
+# Per-context word limit when there is a single context, and when there are several
+SINGLE_CONTEXT_MAX_WORDS = 450
+MULTI_CONTEXT_MAX_WORDS = 150
+
+def _shingles(text: str) -> frozenset:
+    """Hashed word trigrams of the part of the text that can reach the checker."""
+    words = text.split(None, SINGLE_CONTEXT_MAX_WORDS)[:SINGLE_CONTEXT_MAX_WORDS]
+    if len(words) < 3:
+        # Too short for trigrams: the whole text is its only shingle, so it
+        # only duplicates the same words
+        return frozenset((hash(tuple(words)),))
+    return frozenset(hash(trigram) for trigram in zip(words, words[1:], words[2:]))
+
+def _is_near_duplicate(shingles: frozenset, kept: List[frozenset]) -> bool:
+    for other in kept:
+        if len(shingles & other) / len(shingles | other) > NEAR_DUPLICATE_JACCARD:
+            return True
+    return False
+
 def extract_contexts(docs_reranked: List[dict], max_contexts: int = 3) -> List[str]:
-    """Extract and truncate context from documents."""
+    """Extract and truncate context from documents, skipping near-duplicates."""
     try:
-        contexts = [
-            truncate_text(doc.get('content', ''))
-            for doc in docs_reranked[:max_contexts]
-        ]
+        contents, kept_shingles = [], []
+        for doc in docs_reranked:
+            if len(contents) == max_contexts:
+                break
+            content = doc.get('content', '')
+            shingles = _shingles(content)
+            if _is_near_duplicate(shingles, kept_shingles):
+                continue
+            contents.append(content)
+            kept_shingles.append(shingles)
+        
+        # Several contexts share the rerank/grounding payload, so each gets less
+        max_length = MULTI_CONTEXT_MAX_WORDS if len(contents) > 1 else SINGLE_CONTEXT_MAX_WORDS
+        contexts = [truncate_text(content, max_length) for content in contents]
         logger.debug(f"Extracted {len(contexts)} contexts")
         return contexts
     except Exception as e:
         logger.error(f"Error extracting contexts: {str(e)}")
         raise
 
+@traceable(name="faithfulness_check")
 async def check_hallucination(
     question: str,
     answer: str,
     contexts: Union[str, List[str]],
-    cohere_api_key: str,
-    threshold: float = 0.5
+    cohere_api_key: str = None,
+    threshold: float = 0.5,
+    client: Optional[cohere.AsyncClient] = None
 ) -> float:
-    """Check if the generated answer is faithful to the provided contexts."""
+    """
+    Check if the generated answer is faithful to the provided contexts.
+
+    Uses ``client`` when given, otherwise the shared pooled client for
+    ``cohere_api_key`` (default: the COHERE_API_KEY environment variable).
+    """
+    global _grounding_retry_at
     try:
-        from langsmith import trace
-        
-        with trace(name="faithfulness_check"):
-            import cohere
-            import asyncio
-            from concurrent.futures import ThreadPoolExecutor
-            import logging
+        # Validate inputs
+        if not answer or not question or not contexts:
+            logger.warning("Missing required inputs for hallucination check")
+            return 0.5  # Return neutral score if inputs are invalid
             
-            logger = logging.getLogger(__name__)
+        # Shared client; connections are reused across checks
+        if client is None:
+            client = _get_cohere_client(cohere_api_key or os.getenv('COHERE_API_KEY'))
+        
+        # Prepare the prompt with the answer and context
+        if isinstance(contexts, list):
+            combined_context = "\n\n".join(contexts)
+        else:
+            combined_context = contexts
+        
+        # Identical checks (retries, repeated questions) skip the API call
+        cache_key = _score_key(question, answer, combined_context)
+        cached_score = _SCORE_CACHE.get(cache_key)
+        if cached_score is not None:
+            logger.info(f"Cached faithfulness score: {cached_score}")
+            return cached_score
+        
+        try:
+            # Try grounding first, unless it was recently found unavailable
+            if time.monotonic() >= _grounding_retry_at:
+                try:
+                    # Use grounding endpoint when available
+                    result = await client.ground(text=answer, context=combined_context)
+                    
+                    # Extract the score
+                    if hasattr(result, 'grounding_score'):
+                        score = float(result.grounding_score)
+                        logger.info(f"Grounding score: {score}")
+                        _SCORE_CACHE.set(cache_key, score)
+                        return score
+                except Exception as grounding_error:
+                    logger.warning(f"Grounding API not available: {str(grounding_error)}")
+                    if _grounding_unavailable(grounding_error):
+                        _grounding_retry_at = time.monotonic() + GROUNDING_REPROBE_INTERVAL
+                        logger.info(f"Skipping grounding for the next {GROUNDING_REPROBE_INTERVAL}s")
             
-            # Validate inputs
-            if not answer or not question or not contexts:
-                logger.warning("Missing required inputs for hallucination check")
-                return 0.5  # Return neutral score if inputs are invalid
+            # Fall back to rerank correlations
+            try:
+                # Use rerank as a fallback, batched with concurrent checks of the same question
+                scores = await _RERANKER.submit(client, question, [
+                    {"text": answer},
+                    {"text": combined_context}
+                ])
                 
-            # Create Cohere client
-            client = cohere.Client(api_key=cohere_api_key)
-            
-            # Prepare the prompt with the answer and context
-            if isinstance(contexts, list):
-                combined_context = "\n\n".join(contexts)
-            else:
-                combined_context = contexts
+                # Use the context's relevance score as our faithfulness indicator
+                score = float(scores[1])
+                logger.info(f"Fallback faithfulness score: {score}")
+                _SCORE_CACHE.set(cache_key, score)
+                return score
+            except Exception as rerank_error:
+                logger.warning(f"Rerank fallback failed: {str(rerank_error)}")
+                
+            # If all methods fail, return default
+            logger.warning("All hallucination detection methods failed, using default score")
+            return 0.5
+                
+        except Exception as e:
+            logger.error(f"Error checking hallucination: {str(e)}")
+            return 0.5
             
-            # Run the request in a thread to avoid blocking
-            with ThreadPoolExecutor() as executor:
-                try:
-                    # Try grounding first
-                    try:
-                        # Use grounding endpoint when available
-                        result = await asyncio.get_event_loop().run_in_executor(
-                            executor,
-                            lambda: client.ground(
-                                text=answer,
-                                context=combined_context
-                            )
-                        )
-                        
-                        # Extract the score
-                        if hasattr(result, 'grounding_score'):
-                            score = float(result.grounding_score)
-                            logger.info(f"Grounding score: {score}")
-                            return score
-                    except (AttributeError, Exception) as grounding_error:
-                        logger.warning(f"Grounding API not available: {str(grounding_error)}")
-                    
-                    # Fall back to rerank correlations
-                    try:
-                        # Use rerank as a fallback
-                        rerank_result = await asyncio.get_event_loop().run_in_executor(
-                            executor,
-                            lambda: client.rerank(
-                                query=question,
-                                documents=[
-                                    {"text": answer},
-                                    {"text": combined_context}
-                                ],
-                                top_n=2,
-                                model="rerank-english-v3.0"
-                            )
-                        )
-                        
-                        # Extract the relevance score
-                        if rerank_result and hasattr(rerank_result, 'results'):
-                            # Calculate similarity between answer and context
-                            scores = [r.relevance_score for r in rerank_result.results]
-                            if len(scores) >= 2:
-                                # Use the second score (context relevance) as our faithfulness indicator
-                                score = float(scores[1])
-                                logger.info(f"Fallback faithfulness score: {score}")
-                                return score
-                    except Exception as rerank_error:
-                        logger.warning(f"Rerank fallback failed: {str(rerank_error)}")
-                        
-                    # If all methods fail, return default
-                    logger.warning("All hallucination detection methods failed, using default score")
-                    return 0.5
-                        
-                except Exception as e:
-                    logger.error(f"Error checking hallucination: {str(e)}")
-                    return 0.5
-                    
     except Exception as e:
         logger.error(f"Error in hallucination check: {str(e)}")
         return 0.5  # Return neutral score on error
@@ -3,10 +3,13 @@ Nova Flow Module for handling generation and translation with Bedrock API
 """
 import os
 import boto3
-import json
+import orjson
 import asyncio
 import logging
-from typing import Dict, Any, Optional, List, AsyncGenerator
+import weakref
+import threading
+import contextlib
+from typing import Dict, Any, List, AsyncGenerator
 from botocore.config import Config
 import aioboto3
 from src.utils.env_loader import load_environment
@@ -14,6 +17,82 @@ from src.models.system_messages import CLIMATE_SYSTEM_MESSAGE
 
 logger = logging.getLogger(__name__)
 
+# Persona sent as a Bedrock system block with a cache checkpoint, so the
+# prefix is identical across requests and can be served from the prompt cache
+CLIMATE_SYSTEM_BLOCK = [
+    {"text": CLIMATE_SYSTEM_MESSAGE},
+    {"cachePoint": {"type": "default"}}
+]
+# The system block serialized once; request bodies are spliced onto it
+# instead of re-encoding the persona on every call
+_CLIMATE_SYSTEM_PREFIX = b'{"system":' + orjson.dumps(CLIMATE_SYSTEM_BLOCK) + b','
+
+def _dumps_with_climate_system(payload: Dict[str, Any]) -> bytes:
+    """Serialize a non-empty request body with CLIMATE_SYSTEM_BLOCK as its system field."""
+    return _CLIMATE_SYSTEM_PREFIX + orjson.dumps(payload)[1:]
+
+# Bedrock clients are expensive to build (credential resolution, endpoint
+# setup, TLS), so they are created once and shared by every BedrockModel.
+# A larger pool keeps concurrent async calls from queueing on 10 connections.
+BEDROCK_CLIENT_CONFIG = Config(
+    read_timeout=300,
+    connect_timeout=300,
+    max_pool_connections=50,
+    retries={'max_attempts': 3}
+)
+
+_SYNC_CLIENT = None
+_SYNC_CLIENT_LOCK = threading.Lock()
+# aiobotocore clients are tied to the event loop they were opened on
+_ASYNC_CLIENTS = weakref.WeakKeyDictionary()
+
+def _get_sync_client(session):
+    """Return the process-wide synchronous bedrock-runtime client."""
+    global _SYNC_CLIENT
+    if _SYNC_CLIENT is None:
+        with _SYNC_CLIENT_LOCK:
+            if _SYNC_CLIENT is None:
+                _SYNC_CLIENT = session.client(
+                    service_name='bedrock-runtime',
+                    region_name='us-east-1',
+                    config=BEDROCK_CLIENT_CONFIG
+                )
+    return _SYNC_CLIENT
+
+async def _get_async_client(session):
+    """Return the bedrock-runtime client shared by all calls on the running event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _ASYNC_CLIENTS.get(loop)
+    if entry is None:
+        entry = _ASYNC_CLIENTS[loop] = {'lock': asyncio.Lock(), 'client': None}
+    if entry['client'] is None:
+        async with entry['lock']:
+            if entry['client'] is None:
+                entry['client'] = await session.client(
+                    service_name='bedrock-runtime',
+                    region_name='us-east-1',
+                    config=BEDROCK_CLIENT_CONFIG
+                ).__aenter__()
+                logger.info("✓ Shared async Bedrock client opened")
+    return entry['client']
+
+async def close_async_client() -> None:
+    """Close the running event loop's shared async Bedrock client.
+
+    Call before the loop is shut down; a later call on the same loop opens a new client.
+    """
+    entry = _ASYNC_CLIENTS.pop(asyncio.get_running_loop(), None)
+    if entry is None or entry['client'] is None:
+        return
+    try:
+        await entry['client'].__aexit__(None, None, None)
+        logger.info("Shared async Bedrock client closed")
+    except Exception as e:
+        logger.warning(f"Error closing async Bedrock client: {str(e)}")
+
+# Output budget for nova_classification with options: enough for one short label
+CLASSIFICATION_OPTION_MAX_TOKENS = 5
+
 class BedrockModel:
     """Nova Generation model using Bedrock API."""
     
@@ -34,17 +113,18 @@ class BedrockModel:
                 aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
                 region_name="us-east-1"
             )
-            self.sync_bedrock = self.sync_session.client(
-                service_name='bedrock-runtime',
-                region_name='us-east-1',
-                config=Config(read_timeout=300, connect_timeout=300)
-            )
+            self.sync_bedrock = _get_sync_client(self.sync_session)
             self.model_id = model_id
             logger.info("✓ Bedrock client initialized")
         except Exception as e:
             logger.error(f"Bedrock client initialization failed: {str(e)}")
             raise
 
+    @contextlib.asynccontextmanager
+    async def _bedrock_client(self):
+        """Borrow the shared async Bedrock client; it stays open after the block."""
+        yield await _get_async_client(self.session)
+
     async def nova_classification(self, prompt: str, system_message: str = None, options: List[str] = None) -> str:
         """
         Perform classification using Nova model.
@@ -84,25 +164,22 @@ Answer with ONLY the classification result, no explanations or additional text."
                     }
                 ],
                 "inferenceConfig": {
-                    "maxTokens": 100,
-                    "temperature": 0.1,
+                    # With options only a label is needed, so stop generating right after it
+                    "maxTokens": CLASSIFICATION_OPTION_MAX_TOKENS if options else 100,
+                    "temperature": 0.0 if options else 0.1,
                     "topP": 0.9
                 }
             }
             
-            async with self.session.client(
-                service_name='bedrock-runtime',
-                region_name='us-east-1',
-                config=Config(read_timeout=300, connect_timeout=300)
-            ) as bedrock:
+            async with self._bedrock_client() as bedrock:
                 response = await bedrock.invoke_model(
-                    body=json.dumps(payload),
+                    body=orjson.dumps(payload),
                     modelId=self.model_id,
                     accept="application/json",
                     contentType="application/json"
                 )
                 response_body = await response['body'].read()
-                response_json = json.loads(response_body)
+                response_json = orjson.loads(response_body)
                 result = response_json['output']['message']['content'][0]['text'].strip()
                 
                 # If options were provided, ensure the result is one of the options
@@ -121,13 +198,14 @@ Answer with ONLY the classification result, no explanations or additional text."
             # Return safe fallback if options provided, otherwise empty string
             return options[0] if options and len(options) > 0 else ""
             
-    async def nova_content_generation(self, prompt: str, system_message: str = None) -> str:
+    async def nova_content_generation(self, prompt: str, system_message: str = None, max_tokens: int = 1000) -> str:
         """
         Generate content using Nova model with a specific purpose.
         
         Args:
             prompt (str): The input prompt for generation
             system_message (str, optional): System message to guide the generation
+            max_tokens (int, optional): Output token budget
             
         Returns:
             str: The generated content
@@ -140,36 +218,39 @@ Answer with ONLY the classification result, no explanations or additional text."
             if not system_message:
                 system_message = "You are a helpful assistant that provides accurate and concise information."
                 
-            payload = {
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": [
-                            {"text": f"""[SYSTEM INSTRUCTION]: {system_message}
+            climate_system = system_message == CLIMATE_SYSTEM_MESSAGE
+            if climate_system:
+                # Shared persona: sent as the cacheable system block
+                payload = {
+                    "messages": [{"role": "user", "content": [{"text": prompt}]}]
+                }
+            else:
+                payload = {
+                    "messages": [
+                        {
+                            "role": "user", 
+                            "content": [
+                                {"text": f"""[SYSTEM INSTRUCTION]: {system_message}
 {prompt}"""}
-                        ]
-                    }
-                ],
-                "inferenceConfig": {
-                    "maxTokens": 1000,
-                    "temperature": 0.1,
-                    "topP": 0.9
+                            ]
+                        }
+                    ]
                 }
+            payload["inferenceConfig"] = {
+                "maxTokens": max_tokens,
+                "temperature": 0.1,
+                "topP": 0.9
             }
             
-            async with self.session.client(
-                service_name='bedrock-runtime',
-                region_name='us-east-1',
-                config=Config(read_timeout=300, connect_timeout=300)
-            ) as bedrock:
+            async with self._bedrock_client() as bedrock:
                 response = await bedrock.invoke_model(
-                    body=json.dumps(payload),
+                    body=_dumps_with_climate_system(payload) if climate_system else orjson.dumps(payload),
                     modelId=self.model_id,
                     accept="application/json",
                     contentType="application/json"
                 )
                 response_body = await response['body'].read()
-                response_json = json.loads(response_body)
+                response_json = orjson.loads(response_body)
                 return response_json['output']['message']['content'][0]['text'].strip()
         except Exception as e:
             logger.error(f"Content generation error: {str(e)}")
@@ -200,19 +281,15 @@ Answer with ONLY the classification result, no explanations or additional text."
                 }
             }
 
-            async with self.session.client(
-                service_name='bedrock-runtime',
-                region_name='us-east-1',
-                config=Config(read_timeout=300, connect_timeout=300)
-            ) as bedrock:
+            async with self._bedrock_client() as bedrock:
                 response = await bedrock.invoke_model(
-                    body=json.dumps(payload),
+                    body=orjson.dumps(payload),
                     modelId=self.model_id,
                     accept="application/json",
                     contentType="application/json"
                 )
                 response_body = await response['body'].read()
-                response_json = json.loads(response_body)
+                response_json = orjson.loads(response_body)
                 return response_json['output']['message']['content'][0]['text']
 
         except Exception as e:
@@ -259,81 +336,70 @@ Answer with ONLY the classification result, no explanations or additional text."
                 }
             }
 
-            async with self.session.client(
-                service_name='bedrock-runtime',
-                region_name='us-east-1',
-                config=Config(read_timeout=300, connect_timeout=300)
-            ) as bedrock:
+            async with self._bedrock_client() as bedrock:
                 response = await bedrock.invoke_model(
-                    body=json.dumps(payload),
+                    body=orjson.dumps(payload),
                     modelId=self.model_id,
                     accept="application/json",
                     contentType="application/json"
                 )
                 response_body = await response['body'].read()
-                response_json = json.loads(response_body)
+                response_json = orjson.loads(response_body)
                 return response_json['output']['message']['content'][0]['text']
 
         except Exception as e:
             logger.error(f"Translation error: {str(e)}")
             return text
 
-    async def generate_response(
+    def _build_generation_request(
         self,
         query: str,
         documents: List[dict],
         description: str = None,
         conversation_history: List[dict] = None,
-    ) -> str:
-        """Generate a response using Nova."""
-        try:
-            # Format prompt with context and query
-            formatted_docs = "\n\n".join([
-                f"Document {i+1}:\n{doc.get('content', '')}"
-                for i, doc in enumerate(documents)
-            ])
+    ) -> bytes:
+        """Build the serialized Bedrock request body for a grounded answer."""
+        # Format prompt with context and query
+        formatted_docs = "\n\n".join([
+            f"Document {i+1}:\n{doc.get('content', '')}"
+            for i, doc in enumerate(documents)
+        ])
+        
+        # Format conversation history for context if provided
+        conversation_context = ""
+        enhanced_query = query  # Default to original query
+        
+        if conversation_history and len(conversation_history) > 0:
+            logger.info(f"Processing conversation history: {len(conversation_history)} turns")
+            logger.info(f"Conversation history sample: {conversation_history[:2] if len(conversation_history) >= 2 else conversation_history}")
             
-            # Format conversation history for context if provided
-            conversation_context = ""
-            enhanced_query = query  # Default to original query
+            # Format the conversation history for the prompt
+            history_pairs = []
             
-            if conversation_history and len(conversation_history) > 0:
-                logger.info(f"Processing conversation history: {len(conversation_history)} turns")
-                logger.info(f"Conversation history sample: {conversation_history[:2] if len(conversation_history) >= 2 else conversation_history}")
-                
-                # Format the conversation history for the prompt
-                history_pairs = []
-                last_context = ""
-                
-                for i in range(0, len(conversation_history), 2):
-                    if i + 1 < len(conversation_history):
-                        user_msg = conversation_history[i].get('content', '')
-                        assistant_msg = conversation_history[i+1].get('content', '')
-                        
-                        logger.info(f"Processing turn {i//2 + 1}: User='{user_msg[:100]}...', Assistant='{assistant_msg[:100]}...'")
-                        
-                        history_pairs.append(f"User: {user_msg}\nAssistant: {assistant_msg}")
-                        
-                        # Keep track of the last conversation - useful for context
-                        last_context = f"{user_msg} {assistant_msg}"
-                
-                if history_pairs:
-                    conversation_context = "CONVERSATION HISTORY (use this context for follow-up questions):\n" + "\n\n".join(history_pairs) + "\n\n"
-                    logger.info(f"Formatted conversation context: {len(conversation_context)} characters")
-                    logger.info(f"Conversation context preview: {conversation_context[:200]}...")
-                
-                # Instead of using hardcoded follow-up indicators, we'll perform LLM-based classification
-                # This happens in the input_guardrail module now, using the nova_classification method
-            else:
-                logger.info("No conversation history provided")
+            for i in range(0, len(conversation_history), 2):
+                if i + 1 < len(conversation_history):
+                    user_msg = conversation_history[i].get('content', '')
+                    assistant_msg = conversation_history[i+1].get('content', '')
+                    
+                    logger.info(f"Processing turn {i//2 + 1}: User='{user_msg[:100]}...', Assistant='{assistant_msg[:100]}...'")
+                    
+                    history_pairs.append(f"User: {user_msg}\nAssistant: {assistant_msg}")
             
-            # Use system message from system_messages.py
-            custom_instructions = description if description else "Provide a clear, accurate response based on the given context."
+            if history_pairs:
+                conversation_context = "CONVERSATION HISTORY (use this context for follow-up questions):\n" + "\n\n".join(history_pairs) + "\n\n"
+                logger.info(f"Formatted conversation context: {len(conversation_context)} characters")
+                logger.info(f"Conversation context preview: {conversation_context[:200]}...")
             
-            # Create the full prompt text for logging
-            full_prompt_text = f"""[SYSTEM INSTRUCTION]: {CLIMATE_SYSTEM_MESSAGE}
-
-{conversation_context}
+            # Instead of using hardcoded follow-up indicators, we'll perform LLM-based classification
+            # This happens in the input_guardrail module now, using the nova_classification method
+        else:
+            logger.info("No conversation history provided")
+        
+        # Use system message from system_messages.py
+        custom_instructions = description if description else "Provide a clear, accurate response based on the given context."
+        
+        # Create the full prompt text for logging; the persona goes in the system block
+        full_prompt_text = f"""{conversation_context}
 
 Based on the above conversation history and the following documents, provide a direct answer to this question: {enhanced_query}
 
@@ -354,39 +420,47 @@ Additional Instructions:
 9. DO NOT start your response by repeating the user's question in the header
 10. If the question refers to something from the previous conversation (using words like "this", "they", "it"), make sure to clearly identify what is being referenced and provide context-aware answers."""
 
-            logger.info(f"Full prompt being sent to Nova (first 500 chars): {full_prompt_text[:500]}...")
-            
-            prompt = {
-                "messages": [
-                    {
-                        "role": "user", 
-                        "content": [
-                            {"text": full_prompt_text}
-                        ]
-                    }
-                ],
-                "inferenceConfig": {
-                    "maxTokens": 10000,
-                    "temperature": 0.1,
-                    "topP": 0.9,
-                    "stopSequences": []
+        logger.info(f"Full prompt being sent to Nova (first 500 chars): {full_prompt_text[:500]}...")
+        
+        prompt = {
+            "messages": [
+                {
+                    "role": "user", 
+                    "content": [
+                        {"text": full_prompt_text}
+                    ]
                 }
+            ],
+            "inferenceConfig": {
+                "maxTokens": 10000,
+                "temperature": 0.1,
+                "topP": 0.9,
+                "stopSequences": []
             }
+        }
+        return _dumps_with_climate_system(prompt)
+
+    async def generate_response(
+        self,
+        query: str,
+        documents: List[dict],
+        description: str = None,
+        conversation_history: List[dict] = None,
+    ) -> str:
+        """Generate a response using Nova."""
+        try:
+            body = self._build_generation_request(query, documents, description, conversation_history)
             
             # Call Bedrock
-            async with self.session.client(
-                service_name='bedrock-runtime',
-                region_name='us-east-1',
-                config=Config(read_timeout=300, connect_timeout=300)
-            ) as bedrock:
+            async with self._bedrock_client() as bedrock:
                 response = await bedrock.invoke_model(
-                    body=json.dumps(prompt),
+                    body=body,
                     modelId=self.model_id,
                     accept="application/json",
                     contentType="application/json"
                 )
                 response_body = await response['body'].read()
-                response_json = json.loads(response_body)
+                response_json = orjson.loads(response_body)
                 
                 # Extract response text
                 response_text = response_json['output']['message']['content'][0]['text']
@@ -400,6 +474,46 @@ Additional Instructions:
             logger.error(f"Error in generate_response: {str(e)}")
             raise
     
+    async def generate_response_stream(
+        self,
+        query: str,
+        documents: List[dict],
+        description: str = None,
+        conversation_history: List[dict] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream a response from Nova, yielding text as complete lines arrive."""
+        try:
+            body = self._build_generation_request(query, documents, description, conversation_history)
+            
+            async with self._bedrock_client() as bedrock:
+                response = await bedrock.invoke_model_with_response_stream(
+                    body=body,
+                    modelId=self.model_id,
+                    accept="application/json",
+                    contentType="application/json"
+                )
+                # Header fixes are line based, so hold back the unfinished last line
+                pending = ""
+                async for event in response['body']:
+                    chunk = event.get('chunk')
+                    if not chunk:
+                        continue
+                    event_json = orjson.loads(chunk['bytes'])
+                    text = event_json.get('contentBlockDelta', {}).get('delta', {}).get('text')
+                    if not text:
+                        continue
+                    pending += text
+                    split = pending.rfind("\n")
+                    if split != -1:
+                        yield self._ensure_proper_markdown(pending[:split + 1])
+                        pending = pending[split + 1:]
+                if pending:
+                    yield self._ensure_proper_markdown(pending)
+                    
+        except Exception as e:
+            logger.error(f"Error in generate_response_stream: {str(e)}")
+            raise
+    
     def _ensure_proper_markdown(self, text: str) -> str:
         """Ensure markdown headers are properly formatted for rendering."""
         if not text:
@@ -414,9 +528,6 @@ Additional Instructions:
                 # Find the position of the last # in the sequence
                 pos = len(line) - len(line.lstrip('#'))
                 
-                # Get the header level
-                header_level = pos
-                
                 # Check if there's no space after the #s
                 if pos < len(line) and line[pos] != ' ':
                     line = line[:pos] + ' ' + line[pos:]
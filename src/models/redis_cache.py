@@ -1,10 +1,14 @@
 import redis
-import json
+import orjson
 import logging
 import asyncio
 import os
-from typing import Any, Optional
+import time
+import hashlib
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
 from threading import Lock
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +29,18 @@ class RedisCache:
         # Skip initialization if already initialized
         if hasattr(self, '_initialized'):
             return
+        
+        # The in-process tiers work even without Redis; only close() turns them off
+        self._shutdown = False
+        if not hasattr(self, '_semantic'):
+            self._semantic = SemanticCache()
+        if not hasattr(self, '_local'):
+            # L1 in front of Redis for repeated identical lookups; holds the serialized
+            # bytes so every hit decodes a fresh copy callers may mutate
+            self._local = HotCache(
+                maxsize=int(os.getenv('LOCAL_CACHE_SIZE', 512)),
+                ttl=min(expiration, int(os.getenv('LOCAL_CACHE_TTL', 3600)))
+            )
             
         try:
             # Get configuration from environment variables or use provided values
@@ -46,7 +62,9 @@ class RedisCache:
                 'decode_responses': True,
                 'socket_timeout': 5,
                 'socket_connect_timeout': 5,
-                'retry_on_timeout': True
+                'retry_on_timeout': True,
+                # Shared by all to_thread calls; the default executor never needs more
+                'max_connections': int(os.getenv('REDIS_MAX_CONNECTIONS', 64))
             }
             
             # Initialize Redis client with SSL if needed
@@ -84,8 +102,19 @@ class RedisCache:
                 return None
         return self.redis_client
 
+    def get_local(self, key: str) -> Optional[Any]:
+        """Get a value from the in-process tier only, without touching Redis."""
+        if self._shutdown:
+            return None
+        serialized = self._local.get(key)
+        return orjson.loads(serialized) if serialized is not None else None
+
     async def get(self, key: str) -> Optional[Any]:
         """Get value from cache with proper error handling."""
+        local = self.get_local(key)
+        if local is not None:
+            logger.debug(f"Local cache hit for key: {key}")
+            return local
         if self._closed:
             logger.warning("Attempting to use closed Redis connection")
             return None
@@ -100,10 +129,11 @@ class RedisCache:
             value = await asyncio.to_thread(client.get, key)
             if value:
                 try:
-                    decoded = json.loads(value)
+                    decoded = orjson.loads(value)
                     logger.debug(f"Successfully retrieved and decoded cache for key: {key}")
+                    self._local.set(key, value)
                     return decoded
-                except json.JSONDecodeError as e:
+                except orjson.JSONDecodeError as e:
                     logger.error(f"Error decoding cached value: {str(e)}")
                     # Delete corrupt cache entry
                     await asyncio.to_thread(client.delete, key)
@@ -114,8 +144,50 @@ class RedisCache:
             logger.error(f"Cache get error: {str(e)}")
             return None
 
+    async def get_many(self, keys: List[str]) -> List[Optional[Any]]:
+        """Get several values in a single MGET round-trip; misses come back as None."""
+        if not keys:
+            return []
+        results = [self.get_local(key) for key in keys]
+        remote = [i for i, value in enumerate(results) if value is None]
+        if not remote:
+            return results
+        if self._closed:
+            logger.warning("Attempting to use closed Redis connection")
+            return results
+            
+        try:
+            # Get client with reconnection guard
+            client = self._get_client()
+            if not client:
+                return results
+                
+            values = await asyncio.to_thread(client.mget, [keys[i] for i in remote])
+            for i, value in zip(remote, values):
+                if not value:
+                    continue
+                try:
+                    results[i] = orjson.loads(value)
+                    self._local.set(keys[i], value)
+                except orjson.JSONDecodeError as e:
+                    logger.error(f"Error decoding cached value for key {keys[i]}: {str(e)}")
+            logger.debug(f"Batch cache lookup: {sum(r is not None for r in results)}/{len(keys)} hits")
+            return results
+        except Exception as e:
+            logger.error(f"Cache get_many error: {str(e)}")
+            return results
+
     async def set(self, key: str, value: Any) -> bool:
         """Set value in cache with expiration."""
+        if self._shutdown:
+            return False
+        try:
+            # orjson emits UTF-8 directly (no ASCII escaping), like ensure_ascii=False
+            serialized = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except (TypeError, ValueError) as e:
+            logger.error(f"Failed to serialize cache value: {str(e)}")
+            return False
+        self._local.set(key, serialized)
         if self._closed:
             logger.warning("Attempting to use closed Redis connection")
             return False
@@ -126,24 +198,27 @@ class RedisCache:
             if not client:
                 return False
                 
-            try:
-                # Ensure we only store strings, not bytes
-                serialized = json.dumps(value, ensure_ascii=False)
-                success = await asyncio.to_thread(
-                    lambda: client.setex(key, self.expiration, serialized)
-                )
-                if success:
-                    logger.debug(f"Successfully cached value for key: {key}")
-                return bool(success)
-            except (TypeError, ValueError) as e:
-                logger.error(f"Failed to serialize cache value: {str(e)}")
-                return False
+            success = await asyncio.to_thread(
+                lambda: client.setex(key, self.expiration, serialized)
+            )
+            if success:
+                logger.debug(f"Successfully cached value for key: {key}")
+            return bool(success)
         except Exception as e:
             logger.error(f"Cache set error: {str(e)}")
             return False
 
+    def semantic_get(self, query_emb, threshold: float = 0.85, scope: str = '') -> Optional[Tuple[str, List]]:
+        """Return (response, citations) cached for the most similar earlier query in the same scope, if any."""
+        return self._semantic.get(query_emb, threshold, scope)
+
+    def semantic_put(self, query_emb, response: str, citations: List, scope: str = '') -> None:
+        """Remember a response under its query embedding for paraphrase lookups within a scope."""
+        self._semantic.put(query_emb, response, citations, scope)
+
     async def delete(self, key: str) -> bool:
         """Delete value from cache."""
+        self._local.delete(key)
         if self._closed:
             return False
             
@@ -160,6 +235,8 @@ class RedisCache:
 
     async def close(self):
         """Close Redis connection properly."""
+        self._shutdown = True
+        self._local.clear()
         if self._closed or not self.redis_client:
             return
         try:
@@ -180,6 +257,122 @@ class RedisCache:
             except Exception:
                 pass  # Suppress errors during garbage collection
 
+class HotCache:
+    """Small thread-safe in-process LRU with a TTL, used as a tier in front of Redis."""
+
+    def __init__(self, maxsize: int = 512, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Drop a single entry if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop all entries."""
+        with self._lock:
+            self._data.clear()
+
+class SemanticCache:
+    """In-process nearest-neighbour cache keyed by L2-normalized query embeddings.
+
+    Lookup is a brute-force inner product over all stored vectors (the same
+    search a FAISS IndexFlatIP performs), with TTL expiry and LRU replacement
+    once ``maxsize`` entries are stored. Entries only match lookups with the
+    same ``scope`` string, e.g. a digest of the documents the answer cites.
+    Citations are stored serialized, so every hit returns a fresh copy, as
+    RedisCache's in-process tier does.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._vectors = None
+        self._expires = np.zeros(maxsize)
+        self._last_used = np.zeros(maxsize)
+        self._scope_ids = np.zeros(maxsize, dtype=np.int64)
+        self._values: List[Optional[Tuple[str, str, bytes]]] = [None] * maxsize
+        self._size = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def _normalize(query_emb) -> Optional[np.ndarray]:
+        vector = np.asarray(query_emb, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    @staticmethod
+    def _scope_id(scope: str) -> int:
+        """64-bit id of a scope string, so the scope filter is one vectorized comparison."""
+        return int.from_bytes(hashlib.blake2b(scope.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+    def get(self, query_emb, threshold: float = 0.85, scope: str = '') -> Optional[Tuple[str, List]]:
+        """Return the value of the closest unexpired entry in ``scope`` with similarity >= threshold."""
+        query = self._normalize(query_emb)
+        with self._lock:
+            if query is None or not self._size or self._vectors.shape[1] != query.shape[0]:
+                return None
+            now = time.monotonic()
+            scores = self._vectors[:self._size] @ query
+            scores[(self._expires[:self._size] <= now) | (self._scope_ids[:self._size] != self._scope_id(scope))] = -np.inf
+            best = int(np.argmax(scores))
+            # The stored scope string rules out a collision between scope ids
+            if scores[best] < threshold or self._values[best][0] != scope:
+                return None
+            self._last_used[best] = now
+            logger.debug(f"Semantic cache hit with similarity {scores[best]:.3f}")
+            _, response, citations = self._values[best]
+        return response, orjson.loads(citations)
+
+    def put(self, query_emb, response: str, citations: List, scope: str = '') -> None:
+        """Store a value, replacing an expired or least recently used entry when full."""
+        vector = self._normalize(query_emb)
+        if vector is None:
+            return
+        serialized = orjson.dumps(citations, option=orjson.OPT_NON_STR_KEYS)
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+                self._size = 0
+            now = time.monotonic()
+            if self._size < self.maxsize:
+                slot = self._size
+                self._size += 1
+            else:
+                expired = np.flatnonzero(self._expires <= now)
+                slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+            self._vectors[slot] = vector
+            self._expires[slot] = now + self.ttl
+            self._last_used[slot] = now
+            self._scope_ids[slot] = self._scope_id(scope)
+            self._values[slot] = (scope, response, serialized)
+
 # Add alias for compatibility
 ClimateCache = RedisCache
 
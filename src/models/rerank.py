@@ -1,6 +1,7 @@
 import logging
 from typing import List, Dict
 import cohere
+from src.models.doc_utils import clean_content
 from src.utils.env_loader import load_environment
 
 # Configure logging
@@ -23,13 +24,13 @@ def prepare_docs_for_rerank(docs_to_rerank: List[Dict]) -> List[Dict]:
                 continue
                 
             # Clean the content
-            content = content.replace('\\n', ' ').replace('\\"', '"').strip()
+            content = clean_content(content)
             
             # Create the document for reranking
             prepared_doc = {
                 'text': content,
                 'title': doc.get('title', 'No Title'),
-                'url': doc.get('url', [''])[0] if isinstance(doc.get('url', []), list) else doc.get('url', '')
+                'url': doc.get('url', '') or ''
             }
             
             # Store original document structure
@@ -4,12 +4,12 @@ import logging
 import warnings
 import asyncio
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Optional
 from pinecone import Pinecone
 from FlagEmbedding import BGEM3FlagModel
 from src.models.rerank import rerank_fcn
+from src.models.doc_utils import first_url
 from src.utils.env_loader import load_environment
-from langsmith import traceable
 
 # Configure logging
 logging.basicConfig(
@@ -70,9 +70,14 @@ def issue_hybrid_query(index, sparse_embedding: Dict, dense_embedding: List[floa
     )
     return result
 
-def get_hybrid_results(index, query: str, embed_model, alpha: float, top_k: int):
-    """Get hybrid search results."""
+def get_hybrid_results(index, query: str, embed_model, alpha: float, top_k: int, dense_out: Optional[list] = None):
+    """Get hybrid search results.
+
+    If ``dense_out`` is given, the dense query embedding is appended to it.
+    """
     query_dense_embeddings, query_sparse_embeddings = get_query_embeddings(query, embed_model)
+    if dense_out is not None:
+        dense_out.append(query_dense_embeddings[0])
     return issue_hybrid_query(
         index, 
         query_sparse_embeddings[0], 
@@ -81,10 +86,13 @@ def get_hybrid_results(index, query: str, embed_model, alpha: float, top_k: int)
         top_k
     )
 
-async def get_documents(query, index, embed_model, cohere_client, alpha=0.5, top_k=15):
+async def get_documents(query, index, embed_model, cohere_client, alpha=0.5, top_k=15, dense_out=None):
     """
     Get relevant documents from vector store using hybrid search.
     Returns reranked documents sorted by relevance.
+
+    If ``dense_out`` is given, the dense query embedding used for the search is
+    appended to it, so callers can reuse it without encoding the query again.
     """
     try:
         from langsmith import trace
@@ -98,7 +106,8 @@ async def get_documents(query, index, embed_model, cohere_client, alpha=0.5, top
                 query,
                 embed_model, 
                 alpha=alpha,
-                top_k=top_k
+                top_k=top_k,
+                dense_out=dense_out
             )
             
             logger.debug(f"Retrieved {len(hybrid_results.matches)} matches from hybrid search")
@@ -119,7 +128,7 @@ async def get_documents(query, index, embed_model, cohere_client, alpha=0.5, top
                 docs = docs[:15]  # Limit to top 15 for reranking
                 
             # Get reranked documents using run_in_executor for the synchronous rerank_fcn
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
             reranked_docs = await loop.run_in_executor(
                 None, 
                 rerank_fcn,
@@ -223,7 +232,8 @@ def process_search_results(search_results) -> List[Dict]:
                 'segment_id': match.metadata.get('segment_id', ''),
                 'doc_keywords': match.metadata.get('doc_keywords', []),
                 'segment_keywords': match.metadata.get('segment_keywords', []),
-                'url': match.metadata.get('url', [])
+                # Normalized once here so downstream stages can treat url as a plain string
+                'url': first_url(match.metadata.get('url', []))
             }
             
             processed_docs.append(doc)
@@ -239,7 +249,7 @@ def process_search_results(search_results) -> List[Dict]:
 def format_document_output(doc: Dict) -> str:
     """Format document for display with better content preview."""
     output = [
-        f"\nDocument:",
+        "\nDocument:",
         f"Title: {doc['title']}",
         f"Score: {doc['score']:.3f}",
         f"Section: {doc['section_title']}",
@@ -269,8 +279,8 @@ def format_document_output(doc: Dict) -> str:
     output.append(f"\nContent preview: {content}")
     
     # Add source if available
-    if doc['url'] and doc['url'][0]:
-        output.append(f"Source: {doc['url'][0]}")
+    if doc['url']:
+        output.append(f"Source: {doc['url']}")
         
     return "\n".join(output)
 
@@ -140,7 +140,7 @@ if hasattr(torch.utils.data, '_utils'):
 
 # NOW import your custom modules
 from src.utils.env_loader import load_environment
-from src.main_nova import MultilingualClimateChatbot
+from src.main_nova import MultilingualClimateChatbot, close_loop_clients
 
 # Load environment
 load_environment()
@@ -207,6 +207,11 @@ def run_async(coro):
         raise
     finally:
         if loop and not loop.is_closed():
+            try:
+                # Clients shared on this loop cannot be used once it is closed
+                loop.run_until_complete(close_loop_clients())
+            except Exception as e:
+                logger.warning(f"Client cleanup warning: {str(e)}")
             try:
                 pending = asyncio.all_tasks(loop)
                 for task in pending:
@@ -237,13 +242,13 @@ def init_chatbot():
             return {
                 "success": False,
                 "chatbot": None,
-                "error": f"Failed to initialize chatbot: 'MultilingualClimateChatbot' object has no attribute 'climatebert_tokenizer'"
+                "error": "Failed to initialize chatbot: 'MultilingualClimateChatbot' object has no attribute 'climatebert_tokenizer'"
             }
         elif "404" in error_message and "Resource" in error_message and "not found" in error_message:
             return {
                 "success": False,
                 "chatbot": None,
-                "error": f"Failed to initialize chatbot: Pinecone index not found. Please check your environment configuration."
+                "error": "Failed to initialize chatbot: Pinecone index not found. Please check your environment configuration."
             }
         else:
             return {
@@ -345,8 +350,6 @@ def is_rtl_language(language_code):
         return language_code in {'fa', 'ar', 'he'}
 def clean_html_content(content):
     """Clean content from stray HTML tags that might break rendering."""
-    import re
-    
     # Handle the case where content is None
     if content is None:
         return ""
@@ -1072,7 +1075,6 @@ def main():
                             # If content starts with a heading, ensure it's properly formatted
                             if response_content.startswith('#'):
                                 # Make sure there's a space after the # symbols
-                                import re
                                 response_content = re.sub(r'^(#{1,6})([^\s#])', r'\1 \2', response_content)
                         
                         # Update response without header formatting
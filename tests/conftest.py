@@ -33,6 +33,17 @@ def load_env():
     load_dotenv()
     return True
 
+@pytest.fixture(autouse=True)
+def reset_response_cache():
+    """Drop the shared Nova response cache so tests that patch ClimateCache get their mock."""
+    def reset():
+        module = sys.modules.get('src.models.gen_response_nova')
+        if module is not None:
+            module._CACHE = None
+    reset()
+    yield
+    reset()
+
 @pytest.fixture(scope="session")
 def chatbot():
     """Fixture to provide an instance of MultilingualClimateChatbot."""
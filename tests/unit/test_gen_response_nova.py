@@ -1,10 +1,17 @@
+import asyncio
+import hashlib
+from collections import deque
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
+import src.models.gen_response_nova as gen_response_nova
+from src.models.redis_cache import ClimateCache, RedisCache
 from src.models.gen_response_nova import (
     nova_chat,
+    nova_chat_batch,
+    process_batch_queries,
     doc_preprocessing,
-    process_single_doc,
-    generate_cache_key
+    generate_cache_key,
+    generate_batch_cache_key
 )
 
 @pytest.fixture
@@ -23,11 +30,23 @@ def sample_docs():
     ]
 
 @pytest.fixture
-def mock_nova_client():
+def mock_nova_model():
     mock = Mock()
-    mock.nova_chat.return_value = ("Test response about climate change", ["citation1"])
+    mock.generate_response = AsyncMock(return_value="Test response about climate change")
     return mock
 
+def _empty_cache():
+    """Response cache stub that misses on every lookup and accepts every write."""
+    return Mock(
+        get_local=Mock(return_value=None),
+        get=AsyncMock(return_value=None),
+        set=AsyncMock(return_value=True)
+    )
+
+@pytest.fixture
+def no_response_cache():
+    gen_response_nova._CACHE = _empty_cache()
+
 def test_doc_preprocessing_success(sample_docs):
     processed_docs = doc_preprocessing(sample_docs)
     
@@ -69,50 +88,197 @@ def test_generate_cache_key():
     # Different query should generate different key
     assert key1 != generate_cache_key("different query", docs)
 
+def test_generate_cache_key_is_stable_digest():
+    docs = [
+        {'title': 'Doc1', 'url': 'url1'},
+        {'title': 'Doc2', 'url': ['url2']}
+    ]
+    key = generate_cache_key("Test Query ", docs)
+    
+    # Normalized query and document order should not change the key
+    assert key == generate_cache_key("test query", list(reversed(docs)))
+    # Digest is content-based, not the per-process builtin hash()
+    assert key == "nova_response:" + hashlib.blake2b(
+        b"test query\x1fDoc1\x1eurl1\x1fDoc2\x1eurl2", digest_size=16
+    ).hexdigest()
+
 @pytest.mark.asyncio
-async def test_nova_chat_success(sample_docs, mock_nova_client):
+async def test_nova_chat_success(sample_docs, mock_nova_model, no_response_cache):
     response, citations = await nova_chat(
         query="What is climate change?",
         documents=sample_docs,
-        nova_client=mock_nova_client
+        nova_model=mock_nova_model
     )
     
     assert isinstance(response, str)
     assert isinstance(citations, list)
     assert "Test response" in response
-    assert citations == ["citation1"]
-    mock_nova_client.nova_chat.assert_called_once()
+    assert [citation['title'] for citation in citations] == ['Climate Change Overview', 'Global Warming Effects']
+    assert citations[0]['url'] == 'http://example.com/climate'
+    mock_nova_model.generate_response.assert_awaited_once()
 
 @pytest.mark.asyncio
-async def test_nova_chat_no_documents(mock_nova_client):
+async def test_nova_chat_no_documents(mock_nova_model, no_response_cache):
     with pytest.raises(ValueError, match="No valid documents to process"):
         await nova_chat(
             query="test query",
             documents=[],
-            nova_client=mock_nova_client
+            nova_model=mock_nova_model
         )
 
 @pytest.mark.asyncio
-async def test_nova_chat_with_description(sample_docs, mock_nova_client):
+async def test_nova_chat_with_description(sample_docs, mock_nova_model, no_response_cache):
     custom_desc = "Provide a technical response"
     await nova_chat(
         query="What is climate change?",
         documents=sample_docs,
-        nova_client=mock_nova_client,
+        nova_model=mock_nova_model,
         description=custom_desc
     )
     
-    # Verify description was passed to nova_chat
-    call_args = mock_nova_client.nova_chat.call_args[1]
+    # Verify description was passed to the model
+    call_args = mock_nova_model.generate_response.call_args[1]
     assert call_args['description'] == custom_desc
 
 @pytest.mark.asyncio
-async def test_nova_chat_api_error(sample_docs, mock_nova_client):
-    mock_nova_client.nova_chat.side_effect = Exception("API Error")
+async def test_nova_chat_api_error(sample_docs, mock_nova_model, no_response_cache):
+    mock_nova_model.generate_response.side_effect = Exception("API Error")
     
     with pytest.raises(Exception):
         await nova_chat(
             query="test query",
             documents=sample_docs,
-            nova_client=mock_nova_client
-        )
\ No newline at end of file
+            nova_model=mock_nova_model
+        )
+
+@pytest.mark.asyncio
+async def test_nova_chat_hits_local_tier_without_redis(sample_docs, mock_nova_model):
+    # A fresh cache whose Redis connection failed at startup
+    with patch.object(RedisCache, '_instance', None), \
+         patch('redis.Redis', side_effect=Exception("Connection refused")):
+        cache = ClimateCache()
+    assert cache.redis_client is None
+    gen_response_nova._CACHE = cache
+    
+    first = await nova_chat("What is climate change?", sample_docs, mock_nova_model)
+    await asyncio.gather(*gen_response_nova._BACKGROUND_TASKS)
+    second = await nova_chat("What is climate change?", sample_docs, mock_nova_model)
+    
+    assert second == first
+    mock_nova_model.generate_response.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_nova_chat_bounds_conversation_history(sample_docs, mock_nova_model, no_response_cache):
+    messages = [{"role": "user", "content": str(i)} for i in range(12)]
+    bounded = deque(messages, maxlen=gen_response_nova.MAX_HISTORY_TURNS)
+    
+    await nova_chat("Why?", sample_docs, mock_nova_model, conversation_history=bounded)
+    await nova_chat("Why?", sample_docs, mock_nova_model, conversation_history=messages)
+    
+    from_deque, from_list = [call[1]['conversation_history'] for call in mock_nova_model.generate_response.call_args_list]
+    # A bounded deque is used as-is; an unbounded list is cut to the most recent turns
+    assert from_deque == messages[-gen_response_nova.MAX_HISTORY_TURNS:]
+    assert from_list == messages[-gen_response_nova.TRUNCATED_HISTORY_TURNS:]
+
+@pytest.mark.asyncio
+async def test_nova_chat_shares_identical_requests_in_flight(sample_docs):
+    gen_response_nova._CACHE = _empty_cache()
+    
+    async def slow_generate(**kwargs):
+        await asyncio.sleep(0.01)
+        return "Shared response", ["citation1"]
+    
+    with patch('src.models.gen_response_nova._process_documents_and_generate',
+               side_effect=slow_generate) as generate:
+        results = await asyncio.gather(
+            nova_chat("What is climate change?", sample_docs, Mock()),
+            nova_chat("what is climate change? ", sample_docs, Mock())
+        )
+    
+    assert results == [("Shared response", ["citation1"])] * 2
+    assert generate.await_count == 1
+    assert not gen_response_nova._INFLIGHT
+
+@pytest.mark.asyncio
+async def test_nova_chat_follower_takes_over_when_leader_is_cancelled(sample_docs):
+    gen_response_nova._CACHE = _empty_cache()
+    release = asyncio.Event()
+    
+    async def slow_generate(**kwargs):
+        await release.wait()
+        return "Follower response", []
+    
+    with patch('src.models.gen_response_nova._process_documents_and_generate',
+               side_effect=slow_generate) as generate:
+        leader = asyncio.create_task(nova_chat("What is climate change?", sample_docs, Mock()))
+        # Cancel only once the leader is generating, so the follower is waiting on it
+        while generate.await_count == 0:
+            await asyncio.sleep(0)
+        follower = asyncio.create_task(nova_chat("What is climate change?", sample_docs, Mock()))
+        await asyncio.sleep(0.01)
+        assert generate.await_count == 1
+        leader.cancel()
+        release.set()
+        
+        assert await follower == ("Follower response", [])
+        assert leader.cancelled()
+    
+    assert generate.await_count == 2
+    assert not gen_response_nova._INFLIGHT
+
+@pytest.mark.asyncio
+async def test_nova_chat_batch_regenerates_missing_answers(sample_docs):
+    nova_model = Mock()
+    # The model left out the second answer
+    nova_model.nova_content_generation = AsyncMock(return_value="[ANSWER 1]\nFirst answer")
+    
+    with patch('src.models.gen_response_nova.nova_chat',
+               AsyncMock(return_value=("Second answer", []))) as single:
+        answers = await nova_chat_batch(["First?", "Second?"], sample_docs, nova_model)
+    
+    assert answers == ["First answer", "Second answer"]
+    nova_model.nova_content_generation.assert_awaited_once()
+    single.assert_awaited_once()
+    assert single.await_args[0][0] == "Second?"
+
+@pytest.mark.asyncio
+async def test_nova_chat_batch_failed_group_falls_back_to_single_queries(sample_docs):
+    nova_model = Mock()
+    nova_model.nova_content_generation = AsyncMock(side_effect=Exception("Throttled"))
+    
+    async def single(query, documents, model):
+        if query == "Second?":
+            raise Exception("API Error")
+        return f"Answer to {query}", []
+    
+    with patch('src.models.gen_response_nova.nova_chat', side_effect=single):
+        answers = await nova_chat_batch(["First?", "Second?"], sample_docs, nova_model)
+    
+    assert answers == ["Answer to First?", None]
+
+@pytest.mark.asyncio
+async def test_process_batch_queries_generates_only_cache_misses(sample_docs):
+    cache = Mock()
+    cache.get_many = AsyncMock(return_value=[{'response': "Cached answer"}, None])
+    cache.set = AsyncMock(return_value=True)
+    gen_response_nova._CACHE = cache
+    
+    with patch('src.models.gen_response_nova.nova_chat_batch',
+               AsyncMock(return_value=["New answer"])) as batch, \
+         patch('src.models.gen_response_nova.doc_preprocessing',
+               side_effect=doc_preprocessing) as preprocessing:
+        results = await process_batch_queries(["Cached?", "New?"], sample_docs, Mock())
+        await asyncio.sleep(0)
+    
+    assert results == ["Cached answer", "New answer"]
+    assert cache.get_many.await_args[0][0] == [
+        generate_batch_cache_key("Cached?", sample_docs),
+        generate_batch_cache_key("New?", sample_docs)
+    ]
+    assert batch.await_args[0][0] == ["New?"]
+    # Documents are preprocessed once, for both the batch and its citations
+    preprocessing.assert_called_once()
+    cache.set.assert_awaited_once()
+    # Batch answers never land under the key single nova_chat requests read
+    assert cache.set.await_args[0][0] == generate_batch_cache_key("New?", sample_docs)
+    assert cache.set.await_args[0][0] != generate_cache_key("New?", sample_docs)
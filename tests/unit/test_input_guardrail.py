@@ -1,7 +1,9 @@
+import asyncio
 import pytest
-from unittest.mock import Mock, patch, AsyncMock
-from src.models.input_guardrail import topic_moderation, initialize_models
-from transformers.pipelines import Pipeline
+import torch
+from types import SimpleNamespace
+from unittest.mock import Mock
+from src.models.input_guardrail import topic_moderation, topic_moderation_many, _ClimateBertClassifier
 
 @pytest.fixture
 def mock_pipeline():
@@ -94,4 +96,105 @@ async def test_topic_moderation_error_handling():
     
     result = await topic_moderation("test query", pipeline)
     assert result["passed"] is False
-    assert result["reason"] == "not_climate_related"  # Falls back to default rejection
\ No newline at end of file
+    assert result["reason"] == "not_climate_related"  # Falls back to default rejection
+
+@pytest.mark.asyncio
+async def test_topic_moderation_off_topic_matches_whole_words():
+    pipeline = Mock()
+    pipeline.return_value = [{"label": "yes", "score": 0.9}]
+    
+    shopping = await topic_moderation("Which store sells cheap sneakers?", pipeline)
+    restoration = await topic_moderation("How do we restore peatlands?", pipeline)
+    
+    assert shopping["reason"] == "explicitly_off_topic"
+    # 'store' inside 'restore' is not an off-topic keyword
+    assert restoration["reason"] == "climate_related_ml"
+
+@pytest.mark.asyncio
+async def test_topic_moderation_checks_follow_up_before_climate_keywords():
+    pipeline = Mock()
+    history = [{"query": "How does climate change affect crops?", "response": "Heat and drought cut yields."}]
+    
+    ocean = await topic_moderation("What about the ocean?", pipeline, conversation_history=history)
+    coffee = await topic_moderation("what about coffee?", pipeline, conversation_history=history)
+    shoes = await topic_moderation("what about shoes?", pipeline, conversation_history=history)
+    
+    assert ocean["reason"] == "follow_up_question_heuristic"
+    assert ocean["score"] == 0.7
+    assert coffee["passed"] is True
+    assert coffee["reason"] == "follow_up_question_heuristic"
+    # Off-topic keywords are still rejected before follow-up detection
+    assert shoes["reason"] == "explicitly_off_topic"
+    pipeline.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_topic_moderation_punctuation_query_skips_model():
+    pipeline = Mock()
+    pipeline.return_value = [{"label": "yes", "score": 0.9}]
+    
+    result = await topic_moderation("?!", pipeline)
+    
+    assert result["passed"] is False
+    assert result["reason"] == "not_climate_related"
+    pipeline.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_topic_moderation_short_chinese_query_reaches_model():
+    pipeline = Mock()
+    pipeline.return_value = [{"label": "yes", "score": 0.9}]
+    
+    result = await topic_moderation("台风", pipeline)
+    many = await topic_moderation_many(["雾霾"], pipeline)
+    
+    assert result["reason"] == "climate_related_ml"
+    assert many[0]["reason"] == "climate_related_ml"
+    assert pipeline.call_count == 2
+
+@pytest.mark.asyncio
+async def test_topic_moderation_many_batches_undecided_queries():
+    pipeline = Mock()
+    pipeline.return_value = [{"label": "no", "score": 0.8}, {"label": "yes", "score": 0.9}]
+    
+    results = await topic_moderation_many(
+        ["Where can I buy shoes?", "How does weather affect farming?", "Tell me about IPCC reports", "Hi there"],
+        pipeline
+    )
+    
+    assert [r["reason"] for r in results] == [
+        "explicitly_off_topic", "climate_keywords", "climate_related_ml", "not_climate_related_ml"
+    ]
+    # Only the two undecided queries reach the model, in a single call, shortest first
+    pipeline.assert_called_once()
+    assert pipeline.call_args[0][0] == ["Hi there", "Tell me about IPCC reports"]
+
+@pytest.mark.asyncio
+async def test_topic_moderation_coalesces_concurrent_queries():
+    pipeline = Mock()
+    pipeline.return_value = [{"label": "no", "score": 0.8}, {"label": "yes", "score": 0.9}]
+    
+    results = await asyncio.gather(
+        topic_moderation("Tell me about IPCC reports", pipeline),
+        topic_moderation("Hi there", pipeline)
+    )
+    
+    assert [r["reason"] for r in results] == ["climate_related_ml", "not_climate_related_ml"]
+    pipeline.assert_called_once()
+    assert pipeline.call_args[0][0] == ["Hi there", "Tell me about IPCC reports"]
+
+def test_climatebert_classifier_returns_pipeline_style_results():
+    tokenizer = Mock(side_effect=lambda texts, **kwargs: Mock(to=lambda device: {"lengths": [len(text) for text in texts]}))
+    model = Mock(side_effect=lambda lengths: SimpleNamespace(
+        logits=torch.tensor([[0.0, 2.0] if length > 5 else [2.0, 0.0] for length in lengths])
+    ))
+    model.config = SimpleNamespace(id2label={0: "no", 1: "yes"}, num_labels=2, problem_type=None)
+    classifier = _ClimateBertClassifier(model, tokenizer)
+    
+    single = classifier("climate change")
+    batched = classifier(["hi", "climate change", "x"], batch_size=2)
+    
+    # Softmax over two labels, as the text-classification pipeline scores them
+    assert single == [{"label": "yes", "score": pytest.approx(0.8808, abs=1e-4)}]
+    assert [result["label"] for result in batched] == ["no", "yes", "no"]
+    assert batched[1]["score"] == pytest.approx(0.8808, abs=1e-4)
+    # One tokenizer call per batch of at most batch_size texts
+    assert [call.args[0] for call in tokenizer.call_args_list[1:]] == [["hi", "climate change"], ["x"]]
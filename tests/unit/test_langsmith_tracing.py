@@ -2,9 +2,7 @@ import os
 import pytest
 import time
 import asyncio
-from unittest.mock import patch, Mock, MagicMock, AsyncMock
-from langsmith import Client
-from langsmith.run_trees import RunTree
+from unittest.mock import patch, MagicMock, AsyncMock
 import numpy as np
 
 from src.main_nova import MultilingualClimateChatbot
@@ -557,7 +555,7 @@ async def test_complete_pipeline_tracing(mock_nova_chatbot):
 
     # Set up mock for get_hybrid_results that matches signature in retrieval.py
     # Fixed parameter ordering to match how it's called in get_documents: index, query, embed_model
-    def mock_hybrid_results(index, query, embed_model, alpha=0.5, top_k=10):
+    def mock_hybrid_results(index, query, embed_model, alpha=0.5, top_k=10, dense_out=None):
         class Metadata:
             def __init__(self):
                 self.text = "Climate change content"
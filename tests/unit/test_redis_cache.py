@@ -1,8 +1,8 @@
+import asyncio
 import pytest
 from unittest.mock import Mock, patch
 import json
-import redis
-from src.models.redis_cache import ClimateCache
+from src.models.redis_cache import ClimateCache, HotCache, SemanticCache
 
 @pytest.fixture
 def mock_redis_client():
@@ -95,4 +95,76 @@ def test_clear_cache_success(cache_instance, mock_redis_client):
 def test_clear_cache_failure(cache_instance, mock_redis_client):
     mock_redis_client.flushdb.side_effect = Exception("Clear failed")
     result = cache_instance.clear_cache()
-    assert result is False
\ No newline at end of file
+    assert result is False
+
+def test_hot_cache_evicts_least_recently_used():
+    hot = HotCache(maxsize=2, ttl=60)
+    hot.set("a", 1)
+    hot.set("b", 2)
+    assert hot.get("a") == 1  # "a" is now most recently used
+    hot.set("c", 3)
+    assert hot.get("b") is None
+    assert hot.get("a") == 1
+    assert hot.get("c") == 3
+
+def test_hot_cache_expires_entries():
+    hot = HotCache(maxsize=2, ttl=0)
+    hot.set("a", 1)
+    assert hot.get("a") is None
+
+def test_semantic_cache_matches_similar_queries():
+    semantic = SemanticCache(maxsize=4, ttl=60)
+    semantic.put([1.0, 0.0, 0.0], "Climate answer", [{"title": "Doc"}])
+    
+    assert semantic.get([0.95, 0.05, 0.0]) == ("Climate answer", [{"title": "Doc"}])
+    assert semantic.get([0.0, 1.0, 0.0]) is None
+
+def test_semantic_cache_replaces_least_recently_used():
+    semantic = SemanticCache(maxsize=2, ttl=60)
+    semantic.put([1.0, 0.0, 0.0], "A", [])
+    semantic.put([0.0, 1.0, 0.0], "B", [])
+    semantic.get([1.0, 0.0, 0.0])
+    semantic.put([0.0, 0.0, 1.0], "C", [])
+    
+    assert semantic.get([0.0, 1.0, 0.0]) is None
+    assert semantic.get([1.0, 0.0, 0.0]) == ("A", [])
+
+def test_semantic_cache_only_matches_within_scope():
+    semantic = SemanticCache(maxsize=4, ttl=60)
+    semantic.put([1.0, 0.0, 0.0], "Answer from docs A", [{"title": "A"}], scope="docs-a")
+    
+    assert semantic.get([1.0, 0.0, 0.0], scope="docs-b") is None
+    assert semantic.get([1.0, 0.0, 0.0], scope="docs-a") == ("Answer from docs A", [{"title": "A"}])
+
+def test_local_hits_are_copies_and_closed_cache_misses(cache_instance, mock_redis_client):
+    mock_redis_client.closed = False
+    cache_instance.redis_client = mock_redis_client
+    cache_instance._closed = False
+    try:
+        asyncio.run(cache_instance.set("local_key", {"citations": []}))
+        hit = asyncio.run(cache_instance.get("local_key"))
+        hit["citations"].append({"title": "Mutated"})
+        assert asyncio.run(cache_instance.get("local_key")) == {"citations": []}
+        
+        # Redis being unavailable leaves the in-process tier working
+        cache_instance._closed = True
+        assert cache_instance.get_local("local_key") == {"citations": []}
+        assert asyncio.run(cache_instance.get("local_key")) == {"citations": []}
+        
+        # An explicit close() turns it off
+        cache_instance._shutdown = True
+        assert cache_instance.get_local("local_key") is None
+        assert asyncio.run(cache_instance.get("local_key")) is None
+    finally:
+        cache_instance._closed = False
+        cache_instance._shutdown = False
+        asyncio.run(cache_instance.delete("local_key"))
+
+def test_semantic_cache_hits_are_copies():
+    semantic = SemanticCache(maxsize=4, ttl=60)
+    semantic.put([1.0, 0.0, 0.0], "Answer", [{"title": "A"}])
+    
+    _, citations = semantic.get([1.0, 0.0, 0.0])
+    citations.append({"title": "Mutated"})
+    
+    assert semantic.get([1.0, 0.0, 0.0]) == ("Answer", [{"title": "A"}])